@@ -0,0 +1,192 @@
+"""Evaluate the local intent classifier, optionally against the LLM routing it replaces.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.evaluate_intent --llm --output intent.json
+
+The local classifier is scored with stratified k-fold cross-validation over the
+labeled question set, so no question is classified by a model trained on it.
+--llm also routes every question through the two-call LLM routing the
+classifier replaced (is_summary_request, then is_detailed_summary_request,
+kept here as the baseline) against the configured Azure OpenAI endpoint.
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from sklearn.model_selection import StratifiedKFold
+
+
+def score(labels, predictions):
+    per_intent = {}
+    for intent in sorted(set(labels)):
+        indexes = [i for i, label in enumerate(labels) if label == intent]
+        per_intent[intent] = sum(
+            predictions[i] == intent for i in indexes
+        ) / len(indexes)
+    return {
+        "accuracy": sum(p == l for p, l in zip(predictions, labels)) / len(labels),
+        "per_intent_recall": per_intent,
+        "confusion": {
+            f"{label}->{prediction}": count
+            for (label, prediction), count in Counter(zip(labels, predictions)).items()
+            if label != prediction
+        },
+    }
+
+
+def evaluate_local(questions, labels, folds, threshold):
+    from utils.intent_classifier import build_intent_model, predict_intent
+
+    predictions = [None] * len(questions)
+    confidences = [None] * len(questions)
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=0)
+    for train, test in splitter.split(questions, labels):
+        intent_model = build_intent_model().fit(
+            [questions[i] for i in train], [labels[i] for i in train]
+        )
+        for i in test:
+            predictions[i], confidences[i] = predict_intent(questions[i], intent_model)
+
+    started = time.perf_counter()
+    for question in questions:
+        predict_intent(question, intent_model)
+    elapsed = time.perf_counter() - started
+
+    confident = [i for i, confidence in enumerate(confidences) if confidence >= threshold]
+    return predictions, {
+        "router": "local",
+        "folds": folds,
+        **score(labels, predictions),
+        "rule_matches": sum(confidence == 1.0 for confidence in confidences),
+        "llm_fallbacks": len(questions) - len(confident),
+        "confident_accuracy": sum(predictions[i] == labels[i] for i in confident)
+        / len(confident)
+        if confident
+        else None,
+        "ms_per_question": elapsed * 1000 / len(questions),
+    }
+
+
+def ask_yes_no(system_prompt, prompt):
+    from utils.config import model
+    from utils.llm_client import post_chat_completion
+
+    response = post_chat_completion(
+        {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": 0.0,
+        },
+        timeout=60,
+    )
+    response.raise_for_status()
+    return (
+        response.json()
+        .get("choices", [{}])[0]
+        .get("message", {})
+        .get("content", "no")
+        .strip()
+        .lower()
+        == "yes"
+    )
+
+
+def is_summary_request(question):
+    """Baseline routing, first call: is this a whole-document summary request?"""
+    return ask_yes_no(
+        "You are an assistant that detects summary requests.",
+        f"""
+        The user asked the question: {question}
+
+        Determine if this question is about requesting a complete summary of the entire document, tell about the document or any request similar to that.
+        Answer "yes" or "no".
+        """,
+    )
+
+
+def is_detailed_summary_request(question):
+    """Baseline routing, second call: does the summary request ask for detail?"""
+    return ask_yes_no(
+        "You are a helpful assistant that classifies intents.",
+        f"""
+    You are an assistant that classifies user intents. The user's question will be provided,
+    and you must determine if the question explicitly asks for a detailed summary,
+    pagewise summary, topic-wise summary any request similar to that.
+
+    User's question: {question}
+
+    Respond with only "yes" or "no".
+    """,
+    )
+
+
+def evaluate_llm(questions, labels):
+    from respondent import preprocess_text
+
+    predictions = []
+    started = time.perf_counter()
+    for question in questions:
+        preprocessed_question = preprocess_text(question)
+        if not is_summary_request(preprocessed_question):
+            predictions.append("question")
+        elif is_detailed_summary_request(preprocessed_question):
+            predictions.append("detailed_summary")
+        else:
+            predictions.append("summary")
+    elapsed = time.perf_counter() - started
+    return predictions, {
+        "router": "llm",
+        **score(labels, predictions),
+        "ms_per_question": elapsed * 1000 / len(questions),
+    }
+
+
+def parse_args(argv=None):
+    from utils.intent_classifier import INTENT_DATA_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=INTENT_DATA_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--llm", action="store_true", help="also score the LLM routing")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from utils.config import intent_confidence_threshold
+    from utils.intent_classifier import load_intent_examples
+
+    args = parse_args(argv)
+    questions, labels = load_intent_examples(args.data)
+    local_predictions, local_result = evaluate_local(
+        questions, labels, args.folds, intent_confidence_threshold
+    )
+    report = {
+        "questions": len(questions),
+        "intents": dict(Counter(labels)),
+        "confidence_threshold": intent_confidence_threshold,
+        "results": [local_result],
+    }
+    if args.llm:
+        llm_predictions, llm_result = evaluate_llm(questions, labels)
+        llm_result["agreement_with_local"] = sum(
+            l == p for l, p in zip(llm_predictions, local_predictions)
+        ) / len(questions)
+        report["results"].append(llm_result)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
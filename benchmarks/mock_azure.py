@@ -0,0 +1,286 @@
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 765
+EMBEDDING_DIM = 256
+WORDS = (
+    "analysis requirement section clause payment contract schedule delivery "
+    "revenue forecast margin risk control audit policy procedure figure table "
+    "chart result method sample report review summary obligation term party"
+).split()
+
+
+class MockSettings:
+    """Behaviour of the mock Azure OpenAI endpoint."""
+
+    def __init__(
+        self,
+        latency=0.2,
+        ms_per_prompt_token=0.02,
+        ms_per_completion_token=5.0,
+        completion_tokens=150,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        retry_after_ms=500,
+        relevance_rate=0.3,
+        seed=0,
+    ):
+        self.latency = latency
+        self.ms_per_prompt_token = ms_per_prompt_token
+        self.ms_per_completion_token = ms_per_completion_token
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.relevance_rate = relevance_rate
+        self.seed = seed
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def estimate_prompt_tokens(messages):
+    tokens = 0
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            tokens += len(content) // CHARS_PER_TOKEN
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += len(part.get("text", "")) // CHARS_PER_TOKEN
+            else:
+                tokens += IMAGE_TOKENS
+    return tokens
+
+
+def classify_prompt(messages):
+    """Name the kind of app prompt so the mock can answer it plausibly."""
+    system = next(
+        (m.get("content", "") for m in messages if m.get("role") == "system"), ""
+    )
+    if "relevant to a question" in system:
+        return "relevance"
+    if "detects summary requests" in system or "classifies intents" in system:
+        return "intent"
+    if any(isinstance(m.get("content"), list) for m in messages):
+        return "image"
+    return "completion"
+
+
+class MockAzureOpenAI:
+    """Local stand-in for the Azure OpenAI chat-completions and embeddings endpoints."""
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        self.settings = settings or MockSettings()
+        self.random = random.Random(self.settings.seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        """Request counts by kind and status; retries are every non-200 answer."""
+        with self.lock:
+            counts = dict(self.requests)
+        by_kind = Counter()
+        by_status = Counter()
+        for (kind, status), count in counts.items():
+            by_kind[kind] += count
+            by_status[str(status)] += count
+        total = sum(by_kind.values())
+        return {
+            "total": total,
+            "by_kind": dict(by_kind),
+            "by_status": dict(by_status),
+            "retries": total - by_status.get("200", 0),
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests.clear()
+
+    def _roll(self):
+        with self.lock:
+            return self.random.random()
+
+    def _words(self, count):
+        with self.lock:
+            return " ".join(self.random.choice(WORDS) for _ in range(count))
+
+    def _record(self, kind, status):
+        with self.lock:
+            self.requests[(kind, status)] += 1
+
+    def _fault(self):
+        """Return an injected (status, headers) failure, or None to answer normally."""
+        roll = self._roll()
+        if roll < self.settings.rate_limit_rate:
+            return 429, {"retry-after-ms": str(self.settings.retry_after_ms)}
+        if roll < self.settings.rate_limit_rate + self.settings.error_rate:
+            return 500, {}
+        return None
+
+    def chat_completion(self, payload):
+        messages = payload.get("messages", [])
+        kind = classify_prompt(messages)
+        fault = self._fault()
+        if fault:
+            time.sleep(self.settings.latency)
+            return kind, fault[0], fault[1], {"error": {"code": str(fault[0])}}
+
+        prompt_tokens = estimate_prompt_tokens(messages)
+        if kind == "relevance":
+            content = "yes" if self._roll() < self.settings.relevance_rate else "no"
+        elif kind == "intent":
+            content = "question" if "detailed_summary" in json.dumps(messages) else "no"
+        elif payload.get("response_format", {}).get("type") == "json_object":
+            content = self.json_pages(kind, messages)
+        else:
+            max_tokens = payload.get("max_tokens", self.settings.completion_tokens)
+            content = self._words(min(max_tokens, self.settings.completion_tokens))
+        completion_tokens = len(content.split())
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        time.sleep(
+            self.settings.latency + prompt_tokens * self.settings.ms_per_prompt_token / 1000
+        )
+        if payload.get("stream"):
+            # Completion tokens are paced out by the handler as SSE events.
+            return kind, 200, {}, {"stream": content.split(" "), "usage": usage}
+        time.sleep(completion_tokens * self.settings.ms_per_completion_token / 1000)
+        return kind, 200, {}, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    def stream_events(self, body):
+        """SSE events of a streamed completion, one word per delta, then usage."""
+        for index, word in enumerate(body["stream"]):
+            time.sleep(self.settings.ms_per_completion_token / 1000)
+            delta = {"content": word if index == 0 else f" {word}"}
+            yield {"choices": [{"index": 0, "delta": delta}]}
+        yield {"choices": [], "usage": body["usage"]}
+
+    def json_pages(self, kind, messages):
+        """Answer a batched request with one JSON entry per page it mentions."""
+        if kind == "image":
+            marker, field = r"Image for page (\d+):", "explanation"
+        else:
+            marker, field = r"Page (\d+) content:", "summary"
+        page_numbers = re.findall(marker, json.dumps(messages))
+        return json.dumps(
+            {
+                "pages": [
+                    {"page_number": int(page_number), field: self._words(40)}
+                    for page_number in page_numbers
+                ]
+            }
+        )
+
+    def embeddings(self, payload):
+        texts = payload.get("input", [])
+        fault = self._fault()
+        if fault:
+            time.sleep(self.settings.latency)
+            return "embedding", fault[0], fault[1], {"error": {"code": str(fault[0])}}
+
+        prompt_tokens = sum(len(text) // CHARS_PER_TOKEN for text in texts)
+        time.sleep(
+            self.settings.latency + prompt_tokens * self.settings.ms_per_prompt_token / 1000
+        )
+        data = []
+        for index, text in enumerate(texts):
+            # Deterministic per text, so repeated chunks and questions embed alike.
+            generator = random.Random(text)
+            data.append(
+                {
+                    "index": index,
+                    "embedding": [generator.uniform(-1, 1) for _ in range(EMBEDDING_DIM)],
+                }
+            )
+        return "embedding", 200, {}, {
+            "data": data,
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    payload = {}
+
+                path = self.path.split("?", 1)[0]
+                if re.search(r"/chat/completions$", path):
+                    kind, status, headers, body = mock.chat_completion(payload)
+                elif re.search(r"/embeddings$", path):
+                    kind, status, headers, body = mock.embeddings(payload)
+                else:
+                    kind, status, headers, body = "unknown", 404, {}, {"error": "not found"}
+                mock._record(kind, status)
+                if "stream" in body:
+                    self.send_sse(mock.stream_events(body))
+                    return
+
+                encoded = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def send_sse(self, events):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for data in itertools.chain(map(json.dumps, events), ["[DONE]"]):
+                    encoded = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(encoded), encoded))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,245 @@
+"""Ingest and question-answering benchmarks against a local mock Azure OpenAI server.
+
+Run from the repository root, e.g.:
+
+    python -m benchmarks.run_benchmarks --sizes 10 100 --output results.json
+"""
+
+import argparse
+import datetime
+import functools
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from benchmarks.mock_azure import MockAzureOpenAI, MockSettings
+from benchmarks.synthetic_pdfs import PAGE_SIZES, generate_pdf
+
+DEFAULT_QUESTIONS = [
+    "What are the payment obligations of each party?",
+    "Summarize the risk assessment for the business units.",
+    "Which controls does the audit committee review?",
+    "When is the quarterly report due?",
+    "What does the revenue forecast chart show?",
+]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def latency_summary(latencies):
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "max": max(latencies) if latencies else None,
+    }
+
+
+def configure_environment(mock, args):
+    """Point the app config at the mock server; must run before importing app modules."""
+    os.environ.update(
+        {
+            "AZURE_ENDPOINT": mock.endpoint,
+            "API_KEY": "benchmark",
+            "API_VERSION": "2024-06-01",
+            "MODEL": "gpt-4o",
+            "EMBEDDING_MODEL": "text-embedding-3-small",
+            "LLM_RPM": str(args.rpm),
+            "LLM_TPM": str(args.tpm),
+        }
+    )
+
+
+def reset_app_state(cache_dir):
+    """Start every run cold: no shared system prompt and an empty page cache."""
+    import pdf_processing
+    from page_extraction import reset_visual_triage_stats
+    from utils.page_cache import SQLitePageCache, page_cache
+
+    pdf_processing.generated_system_prompt = None
+    reset_visual_triage_stats()
+    page_cache.backend = SQLitePageCache(
+        os.path.join(cache_dir, f"page_cache_{time.monotonic_ns()}.sqlite3"),
+        page_cache.ttl,
+        page_cache.max_entries,
+    )
+    page_cache.hits = page_cache.misses = 0
+
+
+def benchmark_ingest(mock, pdf_path, batch_size, cache_dir):
+    import pdf_processing
+
+    reset_app_state(cache_dir)
+    mock.reset_stats()
+
+    page_latencies = []
+    process_page_batch = pdf_processing.process_page_batch
+
+    def timed_process_page_batch(*args, on_page=None, **kwargs):
+        batch_started = time.perf_counter()
+
+        def timed_on_page(page_data):
+            page_latencies.append(time.perf_counter() - batch_started)
+            if on_page:
+                on_page(page_data)
+
+        return process_page_batch(*args, on_page=timed_on_page, **kwargs)
+
+    get_page_batches = pdf_processing.get_page_batches
+    pdf_processing.process_page_batch = timed_process_page_batch
+    pdf_processing.get_page_batches = functools.partial(
+        get_page_batches, batch_size=batch_size
+    )
+    try:
+        with open(pdf_path, "rb") as f:
+            uploaded_file = io.BytesIO(f.read())
+        uploaded_file.name = os.path.basename(pdf_path)
+
+        started = time.perf_counter()
+        document_data = pdf_processing.process_pdf_pages(uploaded_file, first_file=True)
+        elapsed = time.perf_counter() - started
+    finally:
+        pdf_processing.process_page_batch = process_page_batch
+        pdf_processing.get_page_batches = get_page_batches
+
+    total_pages = len(document_data["pages"])
+    return document_data, {
+        "benchmark": "process_pdf_pages",
+        "document": uploaded_file.name,
+        "pages": total_pages,
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "pages_per_sec": total_pages / elapsed if elapsed else None,
+        "page_latency": latency_summary(page_latencies),
+        "visual_triage": pdf_processing.get_visual_triage_stats(),
+        "image_stats": document_data["image_stats"],
+        "requests": mock.stats(),
+    }
+
+
+def benchmark_questions(mock, document_data, questions):
+    from respondent import ask_question_stream
+
+    doc_name = document_data["document_name"]
+    documents = {doc_name: document_data}
+
+    mock.reset_stats()
+    latencies = []
+    first_chunk_latencies = []
+    started = time.perf_counter()
+    for question in questions:
+        question_started = time.perf_counter()
+        chunks, _ = ask_question_stream(documents, question, [])
+        for index, _ in enumerate(chunks):
+            if index == 0:
+                first_chunk_latencies.append(time.perf_counter() - question_started)
+        latencies.append(time.perf_counter() - question_started)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "benchmark": "ask_question",
+        "document": doc_name,
+        "pages": len(document_data["pages"]),
+        "questions": len(questions),
+        "seconds": elapsed,
+        "questions_per_sec": len(questions) / elapsed if elapsed else None,
+        "question_latency": latency_summary(latencies),
+        "first_chunk_latency": latency_summary(first_chunk_latencies),
+        "requests": mock.stats(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(PAGE_SIZES))
+    parser.add_argument("--image-ratio", type=float, default=0.2)
+    parser.add_argument("--slide-ratio", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--questions", type=int, default=len(DEFAULT_QUESTIONS))
+    parser.add_argument("--skip-questions", action="store_true")
+    parser.add_argument("--rpm", type=int, default=100000)
+    parser.add_argument("--tpm", type=int, default=100000000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.02)
+    parser.add_argument("--ms-per-completion-token", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = MockSettings(
+        latency=args.latency,
+        ms_per_prompt_token=args.ms_per_prompt_token,
+        ms_per_completion_token=args.ms_per_completion_token,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after_ms=args.retry_after_ms,
+        seed=args.seed,
+    )
+    questions = (DEFAULT_QUESTIONS * math.ceil(args.questions / len(DEFAULT_QUESTIONS)))[
+        : args.questions
+    ]
+
+    report = {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "settings": {
+            "mock": settings.to_dict(),
+            "sizes": args.sizes,
+            "image_ratio": args.image_ratio,
+            "slide_ratio": args.slide_ratio,
+            "batch_size": args.batch_size,
+            "rpm": args.rpm,
+            "tpm": args.tpm,
+            "summary_mode": os.getenv("SUMMARY_MODE", "sequential"),
+        },
+        "results": [],
+    }
+
+    with MockAzureOpenAI(settings) as mock, tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(mock, args)
+        for size in args.sizes:
+            pdf_path = generate_pdf(
+                os.path.join(work_dir, f"synthetic_{size}_pages.pdf"),
+                size,
+                args.image_ratio,
+                args.seed,
+                args.slide_ratio,
+            )
+            document_data, ingest_result = benchmark_ingest(
+                mock, pdf_path, args.batch_size, work_dir
+            )
+            report["results"].append(ingest_result)
+            print(
+                f"{size} pages: {ingest_result['pages_per_sec']:.2f} pages/sec",
+                file=sys.stderr,
+            )
+            if not args.skip_questions:
+                report["results"].append(
+                    benchmark_questions(mock, document_data, questions)
+                )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import fitz
+
+PAGE_SIZES = (10, 100, 400)
+WORDS = (
+    "the agreement requires each party to deliver the quarterly report with "
+    "revenue margin forecast and risk assessment for every business unit while "
+    "the audit committee reviews controls procedures and policy exceptions in "
+    "accordance with the schedule described in this section of the document"
+).split()
+
+
+def make_paragraphs(rng, count, words_per_paragraph=60):
+    return [
+        f"[{rng.randint(1000, 9999)}] "
+        + " ".join(rng.choice(WORDS) for _ in range(words_per_paragraph)).capitalize()
+        + "."
+        for _ in range(count)
+    ]
+
+
+def make_image(rng, width=400, height=300):
+    """Noisy RGB image, so it does not compress away like a flat fill would."""
+    samples = bytes(rng.getrandbits(8) for _ in range(width * height * 3))
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+
+
+def add_text_page(document, rng):
+    page = document.new_page()
+    text = "\n\n".join(make_paragraphs(rng, rng.randint(4, 7)))
+    page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=9)
+
+
+def add_slide_page(document, rng):
+    """A converted presentation slide: a title and a few short bullets."""
+    page = document.new_page(width=792, height=612)
+    title = " ".join(rng.choice(WORDS) for _ in range(4)).title()
+    page.insert_text((60, 80), title, fontsize=24)
+    for i in range(rng.randint(2, 4)):
+        bullet = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 8)))
+        page.insert_text((80, 150 + i * 40), f"- {bullet}", fontsize=16)
+
+
+def add_image_page(document, rng):
+    """A scanned-looking page: a large picture, a chart and a short caption."""
+    page = document.new_page()
+    width, height = page.rect.width, page.rect.height
+    page.insert_image(fitz.Rect(50, 50, width - 50, height * 0.55), pixmap=make_image(rng))
+
+    chart_top = height * 0.6
+    for i in range(8):
+        bar_height = rng.uniform(20, 150)
+        left = 70 + i * 55
+        page.draw_rect(
+            fitz.Rect(left, chart_top + 160 - bar_height, left + 40, chart_top + 160),
+            color=(0, 0, 0),
+            fill=(0.2, 0.4, 0.8),
+        )
+    page.insert_text((50, height - 60), make_paragraphs(rng, 1, 12)[0], fontsize=8)
+
+
+def generate_pdf(path, total_pages, image_ratio=0.2, seed=0, slide_ratio=0.0):
+    """Write a synthetic PDF with roughly image_ratio image-heavy and slide_ratio slide pages."""
+    rng = random.Random(seed)
+    document = fitz.open()
+    for _ in range(total_pages):
+        roll = rng.random()
+        if roll < image_ratio:
+            add_image_page(document, rng)
+        elif roll < image_ratio + slide_ratio:
+            add_slide_page(document, rng)
+        else:
+            add_text_page(document, rng)
+    document.save(path, deflate=True)
+    document.close()
+    return path
+
+
+def generate_suite(
+    output_dir, sizes=PAGE_SIZES, image_ratio=0.2, seed=0, slide_ratio=0.0
+):
+    os.makedirs(output_dir, exist_ok=True)
+    return [
+        generate_pdf(
+            os.path.join(output_dir, f"synthetic_{size}_pages.pdf"),
+            size,
+            image_ratio,
+            seed,
+            slide_ratio,
+        )
+        for size in sizes
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark PDFs.")
+    parser.add_argument("output_dir")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(PAGE_SIZES))
+    parser.add_argument("--image-ratio", type=float, default=0.2)
+    parser.add_argument("--slide-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in generate_suite(
+        args.output_dir, args.sizes, args.image_ratio, args.seed, args.slide_ratio
+    ):
+        print(path)
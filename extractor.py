@@ -1,5 +1,7 @@
+import json
 import requests
-from utils.config import azure_endpoint, api_key, api_version, model
+from utils.config import model
+from utils.llm_client import post_chat_completion
 import logging
 import time
 import random
@@ -12,8 +14,6 @@ logging.basicConfig(
 )
 nltk.download("stopwords", quiet=True)
 
-HEADERS = {"Content-Type": "application/json", "api-key": api_key}
-
 
 def preprocess_text(text):
     text = text.lower()
@@ -25,8 +25,14 @@ def preprocess_text(text):
     return text
 
 
-def get_image_explanation(base64_image, retries=10, initial_delay=2, max_delay=60):
-    headers = HEADERS
+def get_image_explanation(
+    base64_image,
+    retries=10,
+    initial_delay=2,
+    max_delay=60,
+    mime_type="image/png",
+    detail="auto",
+):
     data = {
         "model": model,
         "messages": [
@@ -43,7 +49,10 @@ def get_image_explanation(base64_image, retries=10, initial_delay=2, max_delay=6
                     },
                     {
                         "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{base64_image}"},
+                        "image_url": {
+                            "url": f"data:{mime_type};base64,{base64_image}",
+                            "detail": detail,
+                        },
                     },
                 ],
             },
@@ -51,11 +60,9 @@ def get_image_explanation(base64_image, retries=10, initial_delay=2, max_delay=6
         "temperature": 0.0,
     }
 
-    url = f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}"
-
     for attempt in range(retries):
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=120)
+            response = post_chat_completion(data, timeout=120)
             response.raise_for_status()
             return (
                 response.json()
@@ -88,8 +95,81 @@ def get_image_explanation(base64_image, retries=10, initial_delay=2, max_delay=6
     return "Error: Max retries reached without success."
 
 
+def get_batch_image_explanations(images, retries=3, initial_delay=2, max_delay=60):
+    """Explain several page images in one request.
+
+    images is a list of (page_number, base64_image, mime_type, detail). Returns
+    {page_number: explanation} for the pages the model answered, or an empty
+    dict when the request fails or its JSON cannot be parsed.
+    """
+    content = [
+        {
+            "type": "text",
+            "text": "Each of the following images shows part of a document page and is preceded by its page number. "
+            "For every image, explain the contents and figures or tables if present. The explanation should be concise and semantically meaningful. "
+            "Do not make assumptions about the specification and be accurate in your explanation. "
+            'Respond with a JSON object of the form {"pages": [{"page_number": <page number>, "explanation": "<Markdown explanation>"}]} '
+            "containing exactly one entry per image.",
+        }
+    ]
+    for page_number, base64_image, mime_type, detail in images:
+        content.append({"type": "text", "text": f"Image for page {page_number}:"})
+        content.append(
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{mime_type};base64,{base64_image}",
+                    "detail": detail,
+                },
+            }
+        )
+
+    data = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that responds in JSON.",
+            },
+            {"role": "user", "content": content},
+        ],
+        "temperature": 0.0,
+        "response_format": {"type": "json_object"},
+    }
+
+    page_numbers = [page_number for page_number, _, _, _ in images]
+    for attempt in range(retries):
+        try:
+            response = post_chat_completion(data, timeout=120)
+            response.raise_for_status()
+            answer = (
+                response.json()
+                .get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "")
+            )
+            explanations = {}
+            for entry in json.loads(answer)["pages"]:
+                page_number = int(entry["page_number"])
+                explanation = str(entry.get("explanation", "")).strip()
+                if page_number in page_numbers and explanation:
+                    explanations[page_number] = explanation
+            return explanations
+
+        except requests.exceptions.RequestException as e:
+            if attempt == retries - 1:
+                logging.error(f"Error explaining images of pages {page_numbers}: {e}")
+                return {}
+            time.sleep(random.uniform(0, min(max_delay, initial_delay * (2**attempt))))
+
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Unparseable batch explanation for pages {page_numbers}: {e}")
+            return {}
+
+    return {}
+
+
 def generate_system_prompt(document_content):
-    headers = HEADERS
     preprocessed_content = preprocess_text(document_content)
     data = {
         "model": model,
@@ -146,12 +226,7 @@ def generate_system_prompt(document_content):
     }
 
     try:
-        response = requests.post(
-            f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-            headers=headers,
-            json=data,
-            timeout=60,
-        )
+        response = post_chat_completion(data, timeout=60)
         response.raise_for_status()
         prompt_response = (
             response.json()
@@ -175,7 +250,6 @@ def summarize_page(
     base_delay=1,
     max_delay=32,
 ):
-    headers = HEADERS
     
     pattern = r"\[\d{4}\]"  
     paragraph_numbers = re.findall(pattern, page_text)
@@ -203,12 +277,7 @@ def summarize_page(
     attempt = 0
     while attempt < max_retries:
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=data,
-                timeout=60,
-            )
+            response = post_chat_completion(data, timeout=60)
             response.raise_for_status()
             logging.info(
                 f"Summary retrieved for page {page_number} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -234,3 +303,122 @@ def summarize_page(
                 f"Retrying in {jitter:.2f} seconds (attempt {attempt}) due to error: {e}"
             )
             time.sleep(jitter)
+
+
+def summarize_pages(pages, system_prompt, retries=5):
+    """Summarize several short pages in one request.
+
+    pages is a list of (page_number, page_text). Returns {page_number: summary}
+    in summarize_page's format for the pages the model answered, or an empty
+    dict when the request fails or its JSON cannot be parsed.
+    """
+    pattern = r"\[\d{4}\]"
+    page_contents = "\n\n".join(
+        f"Page {page_number} content:\n{preprocess_text(page_text)}"
+        for page_number, page_text in pages
+    )
+    prompt_message = (
+        f"Please rewrite the content of each of the following pages separately to make it concise and well-structured. "
+        f"Maintain proper listing and referencing of the contents if present. "
+        f"Do not add any new information or make assumptions. Keep the meaning accurate and the language clear.\n\n"
+        f"Maintain attribution to line or paragraph if present in the page content\n"
+        f'Respond with a JSON object of the form {{"pages": [{{"page_number": <page number>, "summary": "<rewritten content>"}}]}} '
+        f"containing exactly one entry per page.\n\n"
+        f"{page_contents}\n"
+    )
+
+    data = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt_message},
+        ],
+        "temperature": 0.0,
+        "response_format": {"type": "json_object"},
+    }
+
+    page_texts = dict(pages)
+    for attempt in range(retries):
+        try:
+            response = post_chat_completion(data, timeout=60)
+            response.raise_for_status()
+            answer = (
+                response.json()
+                .get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "")
+            )
+            summaries = {}
+            for entry in json.loads(answer)["pages"]:
+                page_number = int(entry["page_number"])
+                summary = str(entry.get("summary", "")).strip()
+                if page_number in page_texts and summary:
+                    paragraph_numbers = re.findall(pattern, page_texts[page_number])
+                    summaries[page_number] = (
+                        f"{summary}\n Paragraph attribution(If paragraph number is present in the document: {paragraph_numbers}"
+                    )
+            return summaries
+
+        except requests.exceptions.RequestException as e:
+            if attempt == retries - 1:
+                logging.error(f"Error summarizing pages {list(page_texts)}: {e}")
+                return {}
+            time.sleep(random.uniform(0, 2**attempt))
+
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Unparseable packed summary for pages {list(page_texts)}: {e}")
+            return {}
+
+    return {}
+
+
+def summarize_section(
+    page_summaries,
+    first_page,
+    last_page,
+    system_prompt,
+    previous_context="",
+    next_context="",
+    retries=5,
+):
+    """Write a short context note for a run of pages from their first-pass summaries."""
+    summaries = "\n\n".join(page_summaries)
+    prompt_message = (
+        f"Below are independent summaries of pages {first_page} to {last_page} of a document, "
+        f"together with the neighbouring page summaries before and after this section. "
+        f"In at most five sentences, describe what this section covers and how it continues from the preceding "
+        f"content and leads into the following content. Do not repeat the page summaries and do not add any new information.\n\n"
+        f"Preceding page summary: {previous_context or 'None (start of document)'}\n\n"
+        f"Section page summaries:\n{summaries}\n\n"
+        f"Following page summary: {next_context or 'None (end of document)'}\n"
+    )
+
+    data = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt_message},
+        ],
+        "temperature": 0.0,
+        "max_tokens": 300,
+    }
+
+    for attempt in range(retries):
+        try:
+            response = post_chat_completion(data, timeout=60)
+            response.raise_for_status()
+            return (
+                response.json()
+                .get("choices", [{}])[0]
+                .get("message", {})
+                .get("content", "")
+                .strip()
+            )
+
+        except requests.exceptions.RequestException as e:
+            if attempt == retries - 1:
+                logging.error(
+                    f"Error summarizing section of pages {first_page}-{last_page}: {e}"
+                )
+                return f"Error: Unable to summarize pages {first_page}-{last_page}."
+            time.sleep(random.uniform(0, 2**attempt))
@@ -1,37 +1,38 @@
 from azure.storage.blob import BlobServiceClient, ContentSettings
 import streamlit as st
-import json
-import redis
 from io import BytesIO
 from docx import Document
 from urllib.parse import urlparse
-from pdf_processing import process_pdf_task
-from respondent import ask_question, bing_search_topics
+from pdf_processing import (
+    process_pdf_task,
+    stage_upload,
+    get_document_fingerprint,
+    get_ingest_progress,
+    load_pages_from_redis,
+    cancel_ingest,
+)
+from respondent import ask_question_stream
+from utils.redis_client import redis_client
+from utils.document_repository import (
+    find_document,
+    link_document,
+    unlink_document,
+    open_document,
+    open_session_documents,
+    find_session,
+    touch_session,
+    release_expired_sessions,
+)
+from utils.llm_scheduler import llm_lane
+from utils.lexical_index import LexicalIndex
+from utils.web_search import start_web_search, get_web_results
+from utils.tokens import get_document_tokens
 from utils.config import (
-    redis_host,
-    redis_pass,
     azure_blob_connection_string,
     azure_container_name,
-    bing_key,
-    bing_endpoint,
 )
 import uuid
-import tiktoken
 import time
-import requests
-
-def count_tokens(text, model="gpt-4o"):
-    """Count the number of tokens in the text for a specific model."""
-    encoding = tiktoken.encoding_for_model(model)
-    tokens = encoding.encode(text)
-    return len(tokens)
-
-
-redis_client = redis.Redis(
-    host=redis_host,
-    port=6379,
-    password=redis_pass,
-)
 
 
 blob_service_client = BlobServiceClient.from_connection_string(
@@ -43,27 +44,46 @@ if not container_client.exists():
 
 
 if "session_id" not in st.session_state:
-    st.session_state.session_id = str(uuid.uuid4())
+    # A live session_id in the URL reattaches to documents already stored in
+    # Redis; anything else starts a new session.
+    st.session_state.session_id = find_session(
+        st.query_params.get("session_id")
+    ) or str(uuid.uuid4())
+    st.query_params["session_id"] = st.session_state.session_id
+    # Also swept hourly by Celery beat; this covers deployments without it.
+    release_expired_sessions()
+# Every run counts as a visit, sliding the session's expiry.
+touch_session(st.session_state.session_id)
 if "documents" not in st.session_state:
-    st.session_state.documents = {}  
+    # Only manifests live in session state; page data is loaded from Redis on demand.
+    st.session_state.documents = {
+        doc_id: {
+            "name": document["document_name"],
+            "data": document,
+            "tokens": get_document_tokens(document),
+        }
+        for doc_id, document in open_session_documents(
+            st.session_state.session_id
+        ).items()
+    }
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "doc_token" not in st.session_state:
-    st.session_state.doc_token = 0
+    st.session_state.doc_token = sum(
+        doc_info["tokens"] for doc_info in st.session_state.documents.values()
+    )
 if "removed_documents" not in st.session_state:
     st.session_state.removed_documents = []  
-
-
-def save_document_to_redis(session_id, doc_id, document_data):
-    """Save document data to Redis."""
-    redis_key = f"{session_id}:document_data:{doc_id}"
-    redis_client.set(redis_key, json.dumps(document_data))
+if "ingest_jobs" not in st.session_state:
+    st.session_state.ingest_jobs = {}
 
 
 def upload_to_blob_storage(file_name, file_data):
-    """Upload a file to Azure Blob Storage."""
+    """Upload a file to Azure Blob Storage unless that blob already exists."""
     try:
         blob_client = container_client.get_blob_client(file_name)
+        if blob_client.exists():
+            return
         blob_client.upload_blob(
             file_data,
             content_settings=ContentSettings(content_type="application/pdf"),
@@ -74,34 +94,156 @@ def upload_to_blob_storage(file_name, file_data):
         st.error(f"Error uploading to Azure Blob Storage: {e}")
 
 
-import requests
-
-def search_bing(query, bing_key, bing_endpoint):
-    """Search for the top 3 Bing results."""
-    # Set up headers and parameters
-    headers = {"Ocp-Apim-Subscription-Key": bing_key}
-    params = {"q": query, "textDecorations": True, "textFormat": "HTML", "count": 3}
-
-    # Perform the GET request
-    response = requests.get(bing_endpoint, headers=headers, params=params)
-
-    # Raise an error if the request was not successful
-    response.raise_for_status()
-
-    # Parse the JSON response
-    search_results = response.json()
+def start_ingest_jobs(uploaded_files):
+    """Stage uploads in Redis, enqueue their ingestion and register them as documents.
+
+    A file whose content was already processed by any session, with the same
+    pipeline settings, is linked in instantly instead of being reprocessed.
+    """
+    session_id = st.session_state.session_id
+    for uploaded_file in uploaded_files:
+        doc_id = str(uuid.uuid4())
+        file_data = uploaded_file.getvalue()
+        fingerprint = get_document_fingerprint(file_data)
+        if find_document(fingerprint):
+            link_document(session_id, doc_id, fingerprint, uploaded_file.name)
+            if add_processed_document(doc_id, uploaded_file.name):
+                st.success(f"{uploaded_file.name} was already processed and is ready!")
+            continue
+
+        stage_upload(session_id, doc_id, file_data)
+        # Blobs are keyed by content so identical uploads are stored once.
+        upload_to_blob_storage(f"{fingerprint}/{uploaded_file.name}", file_data)
+        task = process_pdf_task.delay(
+            session_id, doc_id, uploaded_file.name, fingerprint
+        )
 
-    # Extract the URLs of the top 3 results
-    results = []
-    for web_page in search_results.get("webPages", {}).get("value", []):
-        results.append(web_page["url"])
+        # Pages and their lexical index grow here until the stored document replaces them.
+        st.session_state.documents[doc_id] = {
+            "name": uploaded_file.name,
+            "data": {
+                "document_name": uploaded_file.name,
+                "pages": [],
+                "lexical_index": LexicalIndex(),
+            },
+        }
+        st.session_state.ingest_jobs[doc_id] = {
+            "name": uploaded_file.name,
+            "task_id": task.id,
+            "processed": 0,
+            "total_pages": 0,
+        }
+
+
+def poll_ingest_job(doc_id, job):
+    """Refresh a job's page progress from Redis and return its Celery task result."""
+    job["processed"], job["total_pages"] = get_ingest_progress(
+        st.session_state.session_id, doc_id
+    )
+    return process_pdf_task.AsyncResult(job["task_id"])
+
+
+def sync_ingested_pages():
+    """Load pages the workers finished so far and add them to their document's lexical index."""
+    session_id = st.session_state.session_id
+    for doc_id in st.session_state.ingest_jobs:
+        document_data = st.session_state.documents[doc_id]["data"]
+        document_data["pages"] = load_pages_from_redis(session_id, doc_id)
+        lexical_index = document_data["lexical_index"]
+        for page in document_data["pages"]:
+            if page["page_number"] not in lexical_index.page_lengths:
+                lexical_index.add_page(page)
+
+
+def discard_document(doc_id):
+    session_id = st.session_state.session_id
+    unlink_document(session_id, doc_id)
+    redis_client.delete(
+        f"{session_id}:document_pages:{doc_id}",
+        f"{session_id}:upload:{doc_id}",
+        f"{session_id}:ingest_progress:{doc_id}",
+    )
+    st.session_state.documents.pop(doc_id, None)
+
+
+def add_processed_document(doc_id, name):
+    """Make a document linked to the session queryable, within the token budget."""
+    session_id = st.session_state.session_id
+    document_data = open_document(session_id, doc_id)
+    if document_data is None:
+        st.error(f"The processed data of {name} is no longer available.")
+        discard_document(doc_id)
+        return False
+    doc_token_count = get_document_tokens(document_data)
+    if st.session_state.doc_token + doc_token_count > 600000:
+        st.warning(
+            "Document contents so far are too large to query. Not processing further documents. "
+            "Results may be inaccurate; consider uploading smaller documents.",
+            icon="⚠️",
+        )
+        discard_document(doc_id)
+        return False
+
+    st.session_state.documents[doc_id] = {
+        "name": name,
+        "data": document_data,
+        "tokens": doc_token_count,
+    }
+    st.session_state.doc_token += doc_token_count
+    return True
+
+
+def finish_ingest_jobs():
+    """Pick up documents whose ingestion task completed since the last run."""
+    session_id = st.session_state.session_id
+    for doc_id, job in list(st.session_state.ingest_jobs.items()):
+        result = poll_ingest_job(doc_id, job)
+        if not result.ready():
+            continue
+        del st.session_state.ingest_jobs[doc_id]
+
+        if not result.successful():
+            st.error(f"Error processing file: {result.result}")
+            discard_document(doc_id)
+            continue
+        if result.result.get("status") == "too_large":
+            st.warning(
+                "The document exceeds the size limit for processing!", icon="⚠️"
+            )
+            discard_document(doc_id)
+            continue
+
+        if add_processed_document(doc_id, job["name"]):
+            st.success(f"{job['name']} processed!")
+
+
+@st.fragment(run_every=2)
+def show_ingest_progress():
+    """Poll ingestion progress and rerun the app once a document finishes."""
+    finished = False
+    for doc_id, job in list(st.session_state.ingest_jobs.items()):
+        finished = poll_ingest_job(doc_id, job).ready() or finished
+        total = job["total_pages"]
+        st.progress(
+            min(job["processed"] / total, 1.0) if total else 0.0,
+            text=f"{job['name']}: {job['processed']}/{total or '?'} pages",
+        )
+    if finished:
+        st.rerun()
 
-    return results
 
+def format_web_links(results):
+    """Markdown list of web result links, labelled by domain."""
+    links = "\n\nMore on web:\n"
+    for link in results:
+        # Parse the URL and extract the hostname (domain)
+        domain = urlparse(link).netloc
+        links += f"🔗 [{domain}]({link})\n"
+    return links
 
 
 def handle_question(prompt, spinner_placeholder):
-    """Handle user question by querying the documents in the session and adding Bing search results."""
+    """Stream the answer to a user question, with Bing results searched alongside it."""
     if prompt:
         try:
             documents_data = {
@@ -114,22 +256,27 @@ def handle_question(prompt, spinner_placeholder):
                 )
                 return
 
-            with spinner_placeholder.container():
-                st.spinner("Thinking...")
-                answer, tot_tokens = ask_question(
-                    documents_data, prompt, st.session_state.chat_history
-                )
-            bing_search_query = str(f"""{prompt}\n{answer}""")
-            search_str = bing_search_topics(bing_search_query)
-            # Get top 3 Bing search results
-            bing_results = search_bing(search_str, bing_key, bing_endpoint)
-
-            # Add the Bing search results to the answer
-            answer += "\n\nMore on web:\n"
-            for i, link in enumerate(bing_results, start=1):
-                # Parse the URL and extract the hostname (domain)
-                domain = urlparse(link).netloc
-                answer += f"🔗 [{domain}]({link})\n"
+            sync_ingested_pages()
+            # Search the web from the question while the answer is prepared.
+            web_search = start_web_search(prompt)
+            with st.chat_message("user"):
+                st.write(prompt)
+            with st.chat_message("assistant"):
+                with llm_lane(st.session_state.session_id):
+                    with spinner_placeholder.container(), st.spinner("Thinking..."):
+                        chunks, tot_tokens = ask_question_stream(
+                            documents_data, prompt, st.session_state.chat_history
+                        )
+                    spinner_placeholder.empty()
+                    # Render tokens as they arrive instead of waiting for the full answer.
+                    answer = st.write_stream(chunks)
+
+                # Waits at most what is left of the search deadline; late results are skipped.
+                web_results = get_web_results(web_search)
+                if web_results:
+                    web_links = format_web_links(web_results)
+                    st.markdown(web_links)
+                    answer += web_links
 
             # Append the question and answer to chat history
             st.session_state.chat_history.append(
@@ -140,8 +287,11 @@ def handle_question(prompt, spinner_placeholder):
             )
         except Exception as e:
             st.error(f"Error processing question: {e}")
+            return
         finally:
             spinner_placeholder.empty()
+        # Redraw from the history, which now holds the answer with its links.
+        st.rerun()
 
 
 def display_chat():
@@ -196,6 +346,7 @@ st.title("docQuest")
 st.subheader("Unveil the Essence, Compare Easily, Analyze Smartly")
 
 with st.sidebar:
+    finish_ingest_jobs()
     with st.expander("Document(s) are ready:", expanded=True):
         to_remove = []
         for doc_id, doc_info in st.session_state.documents.items():
@@ -206,15 +357,21 @@ with st.sidebar:
                 if st.button(f"⨯", key=f"remove_{doc_id}"):
                     to_remove.append(doc_id)
 
+        if st.session_state.ingest_jobs:
+            show_ingest_progress()
+
         for doc_id in to_remove:
-            st.session_state.doc_token -= count_tokens(
-                str(st.session_state.documents[doc_id]["data"])
-            )
+            if doc_id in st.session_state.ingest_jobs:
+                job = st.session_state.ingest_jobs.pop(doc_id)
+                cancel_ingest(st.session_state.session_id, doc_id, job["task_id"])
+            else:
+                st.session_state.doc_token -= st.session_state.documents[doc_id].get(
+                    "tokens", 0
+                )
             st.session_state.removed_documents.append(
                 st.session_state.documents[doc_id]["name"]
             )
-            redis_client.delete(f"{st.session_state.session_id}:document_data:{doc_id}")
-            del st.session_state.documents[doc_id]
+            discard_document(doc_id)
             st.success("Document removed successfully!")
             time.sleep(1)
             st.rerun()
@@ -244,61 +401,13 @@ with st.sidebar:
                     new_files.append(uploaded_file)
 
             if new_files:
-                progress_text = st.empty()
-                progress_bar = st.progress(0)
-                total_files = len(new_files)
-
-                with st.spinner("Learning about your document(s)..."):
-                    try:
-                        for i, uploaded_file in enumerate(new_files):
-                            document_data = process_pdf_task(
-                                uploaded_file, first_file=(i == 0)
-                            )
-                            if not document_data:
-                                st.warning(
-                                    "The document exceeds the size limit for processing!",
-                                    icon="⚠️",
-                                )
-                                uploaded_file.seek(0)
-                                continue
-
-                            doc_token_count = count_tokens(str(document_data))
-                            if st.session_state.doc_token + doc_token_count > 600000:
-                                st.warning(
-                                    "Document contents so far are too large to query. Not processing further documents. "
-                                    "Results may be inaccurate; consider uploading smaller documents.",
-                                    icon="⚠️",
-                                )
-                                continue
-
-                            doc_id = str(uuid.uuid4())
-                            st.session_state.documents[doc_id] = {
-                                "name": uploaded_file.name,
-                                "data": document_data,
-                            }
-                            st.session_state.doc_token += doc_token_count
-                            save_document_to_redis(
-                                st.session_state.session_id, doc_id, document_data
-                            )
-                            
-                            upload_to_blob_storage(
-                                uploaded_file.name, uploaded_file.getvalue()
-                            )
-                            st.success(f"{uploaded_file.name} processed!")
-                            time.sleep(1)
-                            st.rerun()
-                            progress_bar.progress((i + 1) / total_files)
-                    except Exception as e:
-                        st.error(f"Error processing file: {e}")
-
-                progress_text.text("Processing complete.")
-                progress_bar.empty()
+                start_ingest_jobs(new_files)
                 st.rerun()
 
+display_chat()
+
 if st.session_state.documents:
     prompt = st.chat_input("Ask me anything about your documents", key="chat_input")
     spinner_placeholder = st.empty()
     if prompt:
         handle_question(prompt, spinner_placeholder)
-
-display_chat()
@@ -0,0 +1,328 @@
+import base64
+import functools
+import io
+import logging
+import math
+import multiprocessing
+import os
+import re
+import string
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import fitz
+import nltk
+from nltk.corpus import stopwords
+from PIL import Image
+from utils.config import extraction_workers, vision_image_format, vision_image_quality
+
+MIN_IMAGE_AREA_RATIO = 0.01
+MIN_VECTOR_PATHS = 1
+WORKER_DOCUMENT_CACHE_SIZE = 2
+SHARED_MEMORY_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+PARAGRAPH_PATTERN = re.compile(r"\[\d{4}\]")
+VISUAL_ITEM_TYPES = {"fill-path", "stroke-path", "fill-image", "fill-imgmask", "fill-shade"}
+VISION_CROP_MARGIN = 12
+VISION_FULL_PAGE_RATIO = 0.8
+VISION_MAX_ZOOM = 2.0
+VISION_LOW_DETAIL_SIDE = 512
+VISION_HIGH_DETAIL_SHORT_SIDE = 768
+VISION_HIGH_DETAIL_LONG_SIDE = 2048
+VISION_TILE_SIZE = 512
+VISION_MAX_BYTES = 300000
+VISION_MIN_QUALITY = 40
+IMAGE_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+translator = str.maketrans("", "", string.punctuation)
+visual_triage_stats = Counter()
+visual_triage_lock = threading.Lock()
+# PyMuPDF is not thread-safe, so in-process extraction is serialized.
+extraction_lock = threading.Lock()
+
+_stop_words = None
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+_worker_documents = OrderedDict()
+
+
+def get_stop_words():
+    global _stop_words
+    if _stop_words is None:
+        try:
+            _stop_words = set(stopwords.words("english"))
+        except LookupError:
+            nltk.download("stopwords", quiet=True)
+            _stop_words = set(stopwords.words("english"))
+    return _stop_words
+
+
+def remove_stopwords_and_blanks(text):
+    stop_words = get_stop_words()
+    text = text.translate(translator)
+    filtered_text = " ".join(
+        [word for word in text.split() if word.lower() not in stop_words]
+    )
+    return " ".join(filtered_text.split())
+
+
+def classify_page_visuals(page, ocr_text_threshold=0.4, get_bboxlog=None):
+    """Decide from page metadata alone whether a page needs image analysis.
+
+    Returns (needs_analysis, reason). Checks run cheapest first: text coverage,
+    then displayed image area, then the vector paths of the page's bbox log,
+    so text-heavy pages never build it. The log is built whole, but it is
+    far cheaper than get_drawings(); pass get_bboxlog (a cached callable) to
+    share it with get_visual_region.
+    """
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return False, "empty_page"
+
+    text_area = sum(
+        (block[2] - block[0]) * (block[3] - block[1])
+        for block in page.get_text("blocks")
+    )
+    if text_area / page_area >= ocr_text_threshold:
+        return False, "text_coverage"
+
+    image_area = sum(
+        abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info()
+    )
+    if image_area / page_area >= MIN_IMAGE_AREA_RATIO:
+        return True, "images"
+
+    vector_paths = 0
+    for item_type, _ in (get_bboxlog or page.get_bboxlog)():
+        if item_type.endswith("-path"):
+            vector_paths += 1
+            if vector_paths >= MIN_VECTOR_PATHS:
+                return True, "vector_graphics"
+
+    return False, "no_visuals"
+
+
+def record_visual_triage(reason):
+    with visual_triage_lock:
+        visual_triage_stats[reason] += 1
+
+
+def get_visual_triage_stats():
+    """Pages per triage decision reason since the process started."""
+    with visual_triage_lock:
+        return dict(visual_triage_stats)
+
+
+def reset_visual_triage_stats():
+    with visual_triage_lock:
+        visual_triage_stats.clear()
+
+
+def estimate_vision_tokens(width, height, detail):
+    """Vision input tokens of a width x height image under the API's tiling rules."""
+    if detail == "low":
+        return 85
+    scale = min(1, VISION_HIGH_DETAIL_LONG_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1, VISION_HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / VISION_TILE_SIZE) * math.ceil(height / VISION_TILE_SIZE)
+    return 85 + 170 * tiles
+
+
+def get_visual_region(page, bboxlog=None):
+    """Padded bounding box of a page's images and drawings, or the whole page."""
+    region = None
+    for item_type, bbox in bboxlog if bboxlog is not None else page.get_bboxlog():
+        if item_type in VISUAL_ITEM_TYPES:
+            region = fitz.Rect(bbox) if region is None else region | bbox
+    if region is None:
+        return page.rect
+    margin = VISION_CROP_MARGIN
+    region = (region + (-margin, -margin, margin, margin)) & page.rect
+    if region.is_empty or abs(region) >= VISION_FULL_PAGE_RATIO * abs(page.rect):
+        return page.rect
+    return region
+
+
+def encode_pixmap(pix, image_format=vision_image_format, quality=vision_image_quality):
+    """Encode a pixmap, lowering lossy quality until it fits VISION_MAX_BYTES."""
+    if image_format == "png":
+        return pix.tobytes("png")
+    image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    while True:
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format.upper(), quality=quality)
+        if buffer.tell() <= VISION_MAX_BYTES or quality <= VISION_MIN_QUALITY:
+            return buffer.getvalue()
+        quality -= 10
+
+
+def prepare_vision_image(page, bboxlog=None):
+    """Crop, scale and encode a page's visual region for a vision request.
+
+    Regions that fit the low-detail box at 72 dpi are sent with the low detail
+    hint. Larger ones are scaled down to what the API keeps in high detail, or
+    up as far as possible without adding a 512px tile, so resolution grows
+    only where it costs no extra tokens.
+    """
+    region = get_visual_region(page, bboxlog)
+    long_side = max(region.width, region.height)
+    short_side = min(region.width, region.height)
+    if long_side <= VISION_LOW_DETAIL_SIDE:
+        detail = "low"
+        zoom = min(VISION_MAX_ZOOM, VISION_LOW_DETAIL_SIDE / long_side)
+    else:
+        detail = "high"
+        zoom = min(
+            1.0,
+            VISION_HIGH_DETAIL_SHORT_SIDE / short_side,
+            VISION_HIGH_DETAIL_LONG_SIDE / long_side,
+        )
+        if zoom == 1.0:
+            zoom = min(
+                VISION_MAX_ZOOM,
+                *(
+                    math.ceil(side / VISION_TILE_SIZE) * VISION_TILE_SIZE / side
+                    for side in (region.width, region.height)
+                ),
+            )
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=region, alpha=False)
+    if pix.colorspace is None or pix.colorspace.n != 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    data = base64.b64encode(encode_pixmap(pix)).decode("utf-8")
+    return {
+        "data": data,
+        "mime_type": IMAGE_MIME_TYPES[vision_image_format],
+        "detail": detail,
+        "tokens": estimate_vision_tokens(pix.width, pix.height, detail),
+        "baseline_tokens": estimate_vision_tokens(
+            page.rect.width, page.rect.height, "high"
+        ),
+    }
+
+
+def detect_ocr_images_and_vector_graphics_in_pdf(page, ocr_text_threshold=0.4):
+    """Return (prepared vision image or None, triage reason) for a page."""
+    try:
+        # Built at most once, by whichever of triage and cropping needs it first.
+        get_bboxlog = functools.cache(page.get_bboxlog)
+        needs_analysis, reason = classify_page_visuals(
+            page, ocr_text_threshold, get_bboxlog
+        )
+        if not needs_analysis:
+            return None, reason
+        return prepare_vision_image(page, get_bboxlog()), reason
+
+    except Exception as e:
+        logging.error(f"Error detecting OCR images/graphics on page {page.number}: {e}")
+        return None, "error"
+
+
+def extract_page(pdf_document, page_number, ocr_text_threshold=0.4):
+    """All PyMuPDF work for one page, as a compact picklable payload."""
+    try:
+        page = pdf_document.load_page(page_number)
+        raw_text = page.get_text("text").strip()
+        image, visual_reason = detect_ocr_images_and_vector_graphics_in_pdf(
+            page, ocr_text_threshold
+        )
+        return {
+            "page_number": page_number + 1,
+            "text": remove_stopwords_and_blanks(raw_text),
+            "paragraph_numbers": PARAGRAPH_PATTERN.findall(raw_text),
+            "image": image,
+            "visual_reason": visual_reason,
+        }
+
+    except Exception as e:
+        logging.error(f"Error extracting page {page_number + 1}: {e}")
+        return {"page_number": page_number + 1, "error": str(e)}
+
+
+def _get_worker_document(pdf_path):
+    pdf_document = _worker_documents.pop(pdf_path, None)
+    if pdf_document is None:
+        pdf_document = fitz.open(pdf_path)
+    _worker_documents[pdf_path] = pdf_document
+    while len(_worker_documents) > WORKER_DOCUMENT_CACHE_SIZE:
+        _, stale_document = _worker_documents.popitem(last=False)
+        stale_document.close()
+    return pdf_document
+
+
+def extract_page_range(pdf_path, page_numbers, ocr_text_threshold=0.4):
+    """Process-pool entry point: extract pages of a document shared by path."""
+    pdf_document = _get_worker_document(pdf_path)
+    return [
+        extract_page(pdf_document, page_number, ocr_text_threshold)
+        for page_number in page_numbers
+    ]
+
+
+def get_extraction_pool():
+    """Return the shared extraction process pool, or None when it cannot be used.
+
+    Daemonic processes such as Celery prefork workers may not start children,
+    and EXTRACTION_WORKERS=0 disables the pool.
+    """
+    global _extraction_pool
+    if extraction_workers <= 0 or multiprocessing.current_process().daemon:
+        return None
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=extraction_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _extraction_pool
+
+
+def _discard_extraction_pool(pool):
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is pool:
+            _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@contextmanager
+def shared_pdf_file(pdf_bytes):
+    """Write the PDF once to shared memory (or a temp file) for the worker processes."""
+    with tempfile.NamedTemporaryFile(
+        suffix=".pdf", dir=SHARED_MEMORY_DIR, delete=False
+    ) as f:
+        f.write(pdf_bytes)
+        path = f.name
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def extract_pages(pdf_document, page_numbers, ocr_text_threshold=0.4, pdf_path=None):
+    """Extract pages in the process pool when a shared file is given, else in-process."""
+    pages = None
+    pool = get_extraction_pool() if pdf_path else None
+    if pool is not None:
+        try:
+            pages = pool.submit(
+                extract_page_range, pdf_path, list(page_numbers), ocr_text_threshold
+            ).result()
+        except BrokenProcessPool as e:
+            logging.error(f"Extraction pool failed, extracting in-process: {e}")
+            _discard_extraction_pool(pool)
+
+    if pages is None:
+        with extraction_lock:
+            pages = [
+                extract_page(pdf_document, page_number, ocr_text_threshold)
+                for page_number in page_numbers
+            ]
+
+    for page in pages:
+        record_visual_triage(page.get("visual_reason", "error"))
+    return pages
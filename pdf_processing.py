@@ -1,31 +1,56 @@
 import fitz
+import hashlib
 import io
-import base64
+import json
 import logging
-import string
-import nltk
-from celery import Celery
+import os
+import queue
+from celery import Celery, chord
+from celery.result import allow_join_result
+from contextlib import nullcontext
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from nltk.corpus import stopwords
 from file_conversion import convert_office_to_pdf
+from page_extraction import (
+    extract_pages,
+    get_extraction_pool,
+    get_visual_triage_stats,
+    shared_pdf_file,
+)
 from extractor import (
     summarize_page,
+    summarize_pages,
+    summarize_section,
     get_image_explanation,
+    get_batch_image_explanations,
     generate_system_prompt,
 )
-from utils.config import redis_host, redis_pass
-import tiktoken
+from utils.config import (
+    model,
+    redis_host,
+    redis_pass,
+    summary_mode,
+    summary_section_pages,
+    vision_batch_max_images,
+    vision_batch_max_tokens,
+    summary_pack_page_tokens,
+    summary_pack_max_tokens,
+    precompute_document_summary,
+    vision_image_format,
+)
+from utils.redis_client import redis_client
+from utils.page_cache import page_cache
+from utils.llm_scheduler import submit_in_lane, llm_lane
+from utils.embeddings import build_embedding_index
+from utils.lexical_index import build_lexical_index
+from utils.summarizer import build_document_summary
+from utils.document_store import save_document
+from utils.document_repository import (
+    SHARED_NAMESPACE,
+    link_document,
+    release_expired_sessions,
+)
+from utils.tokens import count_tokens, count_page_tokens, get_document_tokens
 import streamlit as st
-import re
-
-def count_tokens(text, model="gpt-4o"):
-    encoding = tiktoken.encoding_for_model(model)
-    tokens = encoding.encode(text)
-    return len(tokens)
-
-
-nltk.download("stopwords", quiet=True)
-stop_words = set(stopwords.words("english"))
 
 logging.basicConfig(
     level=logging.ERROR, format="%(asctime)s [%(levelname)s] %(message)s"
@@ -42,158 +67,675 @@ app.conf.update(
     task_serializer="json",
     result_serializer="json",
     accept_content=["json"],
+    task_track_started=True,
+    task_always_eager=os.getenv("CELERY_TASK_ALWAYS_EAGER", "false").lower() == "true",
+    beat_schedule={
+        "release-expired-sessions": {
+            "task": "pdf_processing.release_expired_sessions_task",
+            "schedule": 3600,
+        },
+    },
 )
 
+UPLOAD_TTL = 24 * 3600
+PAGE_BATCH_SIZE = 5
+# Bump when a processing change should stop reuse of already shared documents.
+PIPELINE_VERSION = 3
+MAX_DOCUMENT_TOKENS = 200000
+SYSTEM_PROMPT_WORDS = 200
+
 generated_system_prompt = None
-translator = str.maketrans("", "", string.punctuation)  
 
 
-def remove_stopwords_and_blanks(text):
-    text = text.translate(translator)  
-    filtered_text = " ".join(
-        [word for word in text.split() if word.lower() not in stop_words]
-    )
-    return " ".join(filtered_text.split())
+def group_vision_images(pages):
+    """Split extracted pages with images into groups within the vision batch budget."""
+    groups = []
+    group = []
+    group_tokens = 0
+    for page in pages:
+        tokens = page["image"]["tokens"]
+        if group and (
+            len(group) >= vision_batch_max_images
+            or group_tokens + tokens > vision_batch_max_tokens
+        ):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(page)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
 
 
-def detect_ocr_images_and_vector_graphics_in_pdf(page, ocr_text_threshold=0.4):
-    try:
-        images = page.get_images(full=True)
-        text_blocks = page.get_text("blocks")
-        vector_graphics_detected = bool(page.get_drawings())
-        page_area = page.rect.width * page.rect.height
-        text_area = sum(
-            (block[2] - block[0]) * (block[3] - block[1]) for block in text_blocks
+def explain_page_images(pages):
+    """Explain the images of a group of extracted pages, in one request when possible.
+
+    Returns {page_number: (explanation, bytes_sent)}. Cached images are not
+    sent, and pages missing from a batched answer fall back to a single call.
+    """
+    results = {}
+    pending = []
+    for page in pages:
+        cached = page_cache.get("image", page["image"]["data"], "")
+        if cached is not None:
+            results[page["page_number"]] = (cached, 0)
+        else:
+            pending.append(page)
+
+    explanations = {}
+    if len(pending) > 1:
+        explanations = get_batch_image_explanations(
+            [
+                (
+                    page["page_number"],
+                    page["image"]["data"],
+                    page["image"]["mime_type"],
+                    page["image"]["detail"],
+                )
+                for page in pending
+            ]
         )
-        text_coverage = text_area / page_area if page_area > 0 else 0
-        pix = page.get_pixmap(dpi=72)  
-        img_data = pix.tobytes("png")
-        base64_image = base64.b64encode(img_data).decode("utf-8")
-        pix = None
 
-        if (images or vector_graphics_detected) and text_coverage < ocr_text_threshold:
-            return base64_image
+    for page in pending:
+        image = page["image"]
+        bytes_sent = len(image["data"]) if len(pending) > 1 else 0
+        explanation = explanations.get(page["page_number"])
+        if explanation is None:
+            explanation = get_image_explanation(
+                image["data"], mime_type=image["mime_type"], detail=image["detail"]
+            )
+            bytes_sent += len(image["data"])
+        page_cache.set("image", image["data"], "", explanation)
+        results[page["page_number"]] = (explanation, bytes_sent)
+    return results
+
 
-    except Exception as e:
-        logging.error(f"Error detecting OCR images/graphics on page {page.number}: {e}")
+def group_short_pages(pages):
+    """Runs of consecutive short pages that fit one packed summary request."""
+    groups = []
+    group = []
+    group_tokens = 0
+    for page in sorted(pages, key=lambda x: x["page_number"]):
+        text = page.get("text", "")
+        tokens = count_tokens(text)
+        is_short = 0 < tokens <= summary_pack_page_tokens
+        if group and (
+            not is_short
+            or page["page_number"] != group[-1]["page_number"] + 1
+            or group_tokens + tokens > summary_pack_max_tokens
+        ):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        if is_short:
+            group.append(page)
+            group_tokens += tokens
+    if group:
+        groups.append(group)
+    return [group for group in groups if len(group) > 1]
 
-    return None
 
+def summarize_page_group(pages, system_prompt):
+    """Summarize a run of short pages in one request, falling back page by page.
 
-def process_page_batch(pdf_document, batch, system_prompt, ocr_text_threshold=0.4):
+    Returns {page_number: summary}; cached pages are not sent again.
+    """
+    results = {}
+    pending = []
+    for page in pages:
+        cached = page_cache.get("summary", page["text"], system_prompt)
+        if cached is not None:
+            results[page["page_number"]] = cached
+        else:
+            pending.append(page)
+
+    summaries = {}
+    if len(pending) > 1:
+        summaries = summarize_pages(
+            [(page["page_number"], page["text"]) for page in pending], system_prompt
+        )
+
+    for page in pending:
+        summary = summaries.get(page["page_number"])
+        if summary is None:
+            summary = summarize_page(page["text"], "", page["page_number"], system_prompt)
+        page_cache.set("summary", page["text"], system_prompt, summary)
+        results[page["page_number"]] = summary
+    return results
+
+
+def process_page_batch(
+    pdf_document,
+    batch,
+    system_prompt,
+    ocr_text_threshold=0.4,
+    on_page=None,
+    pdf_path=None,
+):
     previous_summary = ""
     batch_data = []
 
-    def process_single_page(page_number):
+    def process_single_page(extracted_page):
         nonlocal previous_summary  
+        page_number = extracted_page["page_number"]
         try:
-            page = pdf_document.load_page(page_number)
-            text = remove_stopwords_and_blanks(page.get_text("text").strip())
+            if "error" in extracted_page:
+                raise ValueError(extracted_page["error"])
+            text = extracted_page["text"]
             summary = ""
-            pattern = r"\[\d{4}\]"  
-            paragraph_numbers = re.findall(pattern, page.get_text("text").strip())  
-            if text != "":
-                summary = summarize_page(
-                    text, previous_summary, page_number + 1, system_prompt
+            if page_number in summary_futures:
+                summary = summary_futures[page_number].result()[page_number]
+            elif text != "":
+                summary = page_cache.get_or_compute(
+                    "summary",
+                    text,
+                    system_prompt,
+                    lambda: summarize_page(
+                        text, previous_summary, page_number, system_prompt
+                    ),
                 )
-                previous_summary = summary
+                if summary_mode == "sequential":
+                    previous_summary = summary
 
-            image_data = detect_ocr_images_and_vector_graphics_in_pdf(
-                page, ocr_text_threshold
-            )
+            image = extracted_page["image"]
             image_analysis = []
-            if image_data:
-                image_explanation = get_image_explanation(image_data)
+            if image:
+                image_explanation, bytes_sent = image_futures[page_number].result()[
+                    page_number
+                ]
                 image_analysis.append(
-                    {"page_number": page_number + 1, "explanation": image_explanation}
+                    {
+                        "page_number": page_number,
+                        "explanation": image_explanation,
+                        "bytes_sent": bytes_sent,
+                        "tokens": image["tokens"],
+                        "baseline_tokens": image["baseline_tokens"],
+                    }
                 )
-            return {
-                "page_number": page_number + 1,
-                "full_text": f"{text}\n Paragraph attribution of the page if given in document: {paragraph_numbers}",
+            page_data = {
+                "page_number": page_number,
+                "full_text": f"{text}\n Paragraph attribution of the page if given in document: {extracted_page['paragraph_numbers']}",
                 "text_summary": summary,
                 "image_analysis": image_analysis,
             }
+            page_data["tokens"] = count_page_tokens(page_data)
+            return page_data
 
         except Exception as e:
-            logging.error(f"Error processing page {page_number + 1}: {e}")
+            logging.error(f"Error processing page {page_number}: {e}")
             return {
-                "page_number": page_number + 1,
+                "page_number": page_number,
                 "full_text": "",
                 "text_summary": "Error in processing this page",
                 "image_analysis": [],
+                "tokens": 0,
             }
 
+    extracted_pages = extract_pages(pdf_document, batch, ocr_text_threshold, pdf_path)
+    image_futures = {}
+    summary_futures = {}
     with ThreadPoolExecutor() as page_executor:
+        # Submitted before the pages that wait on them, so they never starve.
+        for group in group_vision_images(
+            [page for page in extracted_pages if page.get("image")]
+        ):
+            future = submit_in_lane(page_executor, explain_page_images, group)
+            for page in group:
+                image_futures[page["page_number"]] = future
+        for group in group_short_pages(
+            [page for page in extracted_pages if "error" not in page]
+        ):
+            future = submit_in_lane(
+                page_executor, summarize_page_group, group, system_prompt
+            )
+            for page in group:
+                summary_futures[page["page_number"]] = future
         future_to_page = {
-            page_executor.submit(process_single_page, page_number): page_number
-            for page_number in batch
+            submit_in_lane(
+                page_executor, process_single_page, extracted_page
+            ): extracted_page["page_number"]
+            for extracted_page in extracted_pages
         }
         for future in as_completed(future_to_page):
-            batch_data.append(future.result())
+            page_data = future.result()
+            batch_data.append(page_data)
+            if on_page:
+                on_page(page_data)
 
     return batch_data
 
 
-def process_pdf_pages(uploaded_file, first_file=False):
-    global generated_system_prompt
+class DocumentTooLargeError(ValueError):
+    pass
+
+
+def open_pdf_document(uploaded_file):
     file_name = uploaded_file.name
+    if file_name.lower().endswith(".pdf"):
+        pdf_stream = io.BytesIO(uploaded_file.read())
+    else:
+        pdf_stream = convert_office_to_pdf(uploaded_file)
+    return fitz.open(stream=pdf_stream, filetype="pdf")
 
-    try:
-        if file_name.lower().endswith(".pdf"):
-            pdf_stream = io.BytesIO(uploaded_file.read())
-        else:
-            pdf_stream = convert_office_to_pdf(uploaded_file)
 
-        pdf_document = fitz.open(stream=pdf_stream, filetype="pdf")
-        document_data = {"document_name": file_name, "pages": []}
-        total_pages = len(pdf_document)
-        
-        
-        full_text = ""
+def build_system_prompt(pdf_document):
+    """Generate the persona prompt from the document's first words.
+
+    Also enforces MAX_DOCUMENT_TOKENS: each page is tokenized once and the
+    scan stops as soon as the running total passes the limit.
+    """
+    total_tokens = 0
+    first_words = []
+    for page_number in range(len(pdf_document)):
+        text = pdf_document.load_page(page_number).get_text("text").strip()
+        total_tokens += count_tokens(text)
+        if total_tokens > MAX_DOCUMENT_TOKENS:
+            raise DocumentTooLargeError("The document exceeds the size limit for processing.")
+        if len(first_words) < SYSTEM_PROMPT_WORDS:
+            first_words.extend(text.split()[: SYSTEM_PROMPT_WORDS - len(first_words)])
+    return generate_system_prompt(" ".join(first_words))
+
+
+def prepare_system_prompt(pdf_document, first_file=False, session_id=None):
+    """Return the persona prompt, shared per session in Redis when session_id is given."""
+    global generated_system_prompt
+    if session_id is None:
         if first_file and generated_system_prompt is None:
-            for page_number in range(total_pages):
-                page = pdf_document.load_page(page_number)
-                full_text += page.get_text("text").strip() + " "
-                
-                if count_tokens(full_text) > 200000:
-                    return ""
-            first_200_words = " ".join(full_text.split()[:200])
-            generated_system_prompt = generate_system_prompt(first_200_words)
-
-        batch_size = 5
-        page_batches = [
-            range(i, min(i + batch_size, total_pages))
-            for i in range(0, total_pages, batch_size)
+            generated_system_prompt = build_system_prompt(pdf_document)
+        return generated_system_prompt
+
+    redis_key = f"{session_id}:system_prompt"
+    system_prompt = redis_client.get(redis_key)
+    if system_prompt is not None:
+        return system_prompt.decode("utf-8")
+    system_prompt = build_system_prompt(pdf_document)
+    redis_client.set(redis_key, system_prompt, nx=True)
+    return system_prompt
+
+
+def get_page_batches(total_pages, batch_size=PAGE_BATCH_SIZE):
+    return [
+        range(i, min(i + batch_size, total_pages))
+        for i in range(0, total_pages, batch_size)
+    ]
+
+
+def iter_pdf_pages(pdf_document, first_file=False, session_id=None):
+    """Yield each page's result as soon as it is processed, in completion order."""
+    system_prompt = prepare_system_prompt(pdf_document, first_file, session_id)
+    page_batches = get_page_batches(len(pdf_document))
+
+    results = queue.Queue()
+    batch_done = object()
+
+    def on_batch_done(future):
+        if not future.cancelled() and future.exception():
+            logging.error(f"Error processing batch: {future.exception()}")
+        results.put(batch_done)
+
+    shared_file = (
+        shared_pdf_file(pdf_document.tobytes())
+        if get_extraction_pool() is not None
+        else nullcontext()
+    )
+    with shared_file as pdf_path:
+        executor = ThreadPoolExecutor()
+        try:
+            for batch in page_batches:
+                future = submit_in_lane(
+                    executor,
+                    process_page_batch,
+                    pdf_document,
+                    batch,
+                    system_prompt,
+                    on_page=results.put,
+                    pdf_path=pdf_path,
+                )
+                future.add_done_callback(on_batch_done)
+
+            pending_batches = len(page_batches)
+            while pending_batches:
+                result = results.get()
+                if result is batch_done:
+                    pending_batches -= 1
+                else:
+                    yield result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_page_sections(pages, section_pages=summary_section_pages):
+    return [pages[i : i + section_pages] for i in range(0, len(pages), section_pages)]
+
+
+def add_section_context(pages, system_prompt):
+    """Second summarization pass: one short context note per section of pages.
+
+    Each section is described from its own first-pass summaries plus the last
+    summary before it and the first summary after it, so every call is
+    independent and the sections are processed in parallel.
+    """
+    sections = get_page_sections(pages)
+
+    def process_section(index):
+        section = sections[index]
+        previous_context = sections[index - 1][-1]["text_summary"] if index > 0 else ""
+        next_context = (
+            sections[index + 1][0]["text_summary"] if index + 1 < len(sections) else ""
+        )
+        page_summaries = [
+            f"Page {page['page_number']}: {page['text_summary']}" for page in section
+        ]
+        first_page = section[0]["page_number"]
+        last_page = section[-1]["page_number"]
+        return page_cache.get_or_compute(
+            "section",
+            "\n".join([previous_context, *page_summaries, next_context]),
+            system_prompt,
+            lambda: summarize_section(
+                page_summaries,
+                first_page,
+                last_page,
+                system_prompt,
+                previous_context,
+                next_context,
+            ),
+        )
+
+    with ThreadPoolExecutor() as section_executor:
+        futures = [
+            submit_in_lane(section_executor, process_section, index)
+            for index in range(len(sections))
         ]
+        for section, future in zip(sections, futures):
+            section_context = future.result()
+            if section_context.startswith("Error"):
+                continue
+            for page in section:
+                page["section_context"] = section_context
 
-        with ThreadPoolExecutor() as executor:
-            future_to_batch = {
-                executor.submit(
-                    process_page_batch, pdf_document, batch, generated_system_prompt
-                ): batch
-                for batch in page_batches
-            }
-            for future in as_completed(future_to_batch):
-                try:
-                    batch_data = future.result()
-                    document_data["pages"].extend(batch_data)
-                except Exception as e:
-                    logging.error(f"Error processing batch: {e}")
 
-        pdf_document.close()
-        document_data["pages"].sort(key=lambda x: x["page_number"])
-        return document_data
+def get_image_stats(document_data):
+    """Vision payload bytes sent and estimated tokens saved by image preparation."""
+    analyses = [
+        analysis
+        for page in document_data["pages"]
+        for analysis in page.get("image_analysis", [])
+    ]
+    tokens = sum(analysis.get("tokens", 0) for analysis in analyses)
+    baseline_tokens = sum(analysis.get("baseline_tokens", 0) for analysis in analyses)
+    return {
+        "images": len(analyses),
+        "bytes_sent": sum(analysis.get("bytes_sent", 0) for analysis in analyses),
+        "tokens": tokens,
+        "baseline_tokens": baseline_tokens,
+        "tokens_saved": baseline_tokens - tokens,
+    }
+
+
+def finalize_document(document_data, system_prompt=None):
+    """Order the collected pages, stitch section context, build the retrieval index
+    and precompute the document summary and topics."""
+    document_data["pages"] = sorted(
+        document_data["pages"], key=lambda x: x["page_number"]
+    )
+    if summary_mode == "two_pass" and system_prompt:
+        add_section_context(document_data["pages"], system_prompt)
+    document_data["embedding_index"] = build_embedding_index(document_data)
+    document_data["lexical_index"] = build_lexical_index(document_data)
+    if precompute_document_summary:
+        document_data["document_summary"] = build_document_summary(document_data)
+    logging.info(
+        f"Page cache stats after {document_data['document_name']}: {page_cache.stats()}"
+    )
+    logging.info(f"Visual triage decisions so far: {get_visual_triage_stats()}")
+    document_data["image_stats"] = get_image_stats(document_data)
+    document_data["tokens"] = get_document_tokens(document_data)
+    logging.info(
+        f"Image stats for {document_data['document_name']}: {document_data['image_stats']}"
+    )
+    return document_data
+
+
+def process_pdf_pages(uploaded_file, first_file=False):
+    file_name = uploaded_file.name
+
+    try:
+        pdf_document = open_pdf_document(uploaded_file)
+        document_data = {"document_name": file_name, "pages": []}
+        try:
+            document_data["pages"].extend(iter_pdf_pages(pdf_document, first_file))
+            system_prompt = prepare_system_prompt(pdf_document)
+        except DocumentTooLargeError:
+            return ""
+        finally:
+            pdf_document.close()
+        return finalize_document(document_data, system_prompt)
 
     except Exception as e:
         logging.error(f"Error processing PDF file {file_name}: {e}")
         raise ValueError(f"Unable to process the file {file_name}. Error: {e}")
 
+def get_upload_key(session_id, doc_id):
+    return f"{session_id}:upload:{doc_id}"
+
+
+def get_document_fingerprint(file_data):
+    """SHA-256 of an upload and of the pipeline settings that shape its processed form."""
+    digest = hashlib.sha256(file_data)
+    digest.update(
+        f"|{PIPELINE_VERSION}|{model}|{summary_mode}|{vision_image_format}".encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def stage_upload(session_id, doc_id, file_data):
+    """Stage the raw upload in Redis so any worker can pick it up."""
+    redis_client.set(get_upload_key(session_id, doc_id), file_data, ex=UPLOAD_TTL)
+
+
+def save_page_to_redis(session_id, doc_id, page_data):
+    """Save a single processed page to Redis as soon as it is available."""
+    redis_key = f"{session_id}:document_pages:{doc_id}"
+    pipe = redis_client.pipeline()
+    pipe.hset(redis_key, page_data["page_number"], json.dumps(page_data))
+    pipe.expire(redis_key, UPLOAD_TTL)
+    pipe.execute()
+
+
+def load_pages_from_redis(session_id, doc_id):
+    """Load the pages of an in-flight document, ordered by page number."""
+    pages = redis_client.hgetall(f"{session_id}:document_pages:{doc_id}")
+    return sorted(
+        (json.loads(page) for page in pages.values()),
+        key=lambda x: x["page_number"],
+    )
+
+
+def get_progress_key(session_id, doc_id):
+    return f"{session_id}:ingest_progress:{doc_id}"
+
+
+def get_cancel_key(session_id, doc_id):
+    return f"{session_id}:ingest_cancelled:{doc_id}"
+
+
+def get_batch_task_id(doc_id, start):
+    return f"{doc_id}:batch:{start}"
+
+
+def is_ingest_cancelled(session_id, doc_id):
+    return redis_client.exists(get_cancel_key(session_id, doc_id)) > 0
+
+
+def cancel_ingest(session_id, doc_id, task_id):
+    """Stop an in-flight ingestion and drop its staged data.
+
+    After replace the original task id belongs to the chord body only, so
+    the deterministic batch task ids are revoked with it. Batches already
+    running see the cancel flag and stop storing pages, and the assemble
+    step no longer links the document.
+    """
+    redis_client.set(get_cancel_key(session_id, doc_id), 1, ex=UPLOAD_TTL)
+    total_pages = int(redis_client.hget(get_progress_key(session_id, doc_id), "total") or 0)
+    app.control.revoke(
+        [
+            task_id,
+            *(
+                get_batch_task_id(doc_id, batch.start)
+                for batch in get_page_batches(total_pages)
+            ),
+        ]
+    )
+    redis_client.delete(
+        get_upload_key(session_id, doc_id),
+        get_progress_key(session_id, doc_id),
+        f"{session_id}:document_pages:{doc_id}",
+    )
+
+
+def report_progress(session_id, doc_id):
+    processed = redis_client.hlen(f"{session_id}:document_pages:{doc_id}")
+    total = int(redis_client.hget(get_progress_key(session_id, doc_id), "total") or 0)
+    progress = {"doc_id": doc_id, "processed": processed, "total": total}
+    redis_client.publish(f"{session_id}:ingest_progress", json.dumps(progress))
+    return progress
+
+
+def get_ingest_progress(session_id, doc_id):
+    """Return (processed, total) pages of an in-flight document."""
+    processed = redis_client.hlen(f"{session_id}:document_pages:{doc_id}")
+    total = int(redis_client.hget(get_progress_key(session_id, doc_id), "total") or 0)
+    return processed, total
+
 
 @app.task(bind=True)
-def process_pdf_task(self, uploaded_file, first_file=False):
+def process_pdf_task(self, session_id, doc_id, file_name, fingerprint=None):
+    """Prepare a staged upload and fan its page batches out to the workers."""
     try:
-        result = process_pdf_pages(uploaded_file, first_file)
-        return result
+        file_data = redis_client.get(get_upload_key(session_id, doc_id))
+        if file_data is None:
+            raise ValueError(f"The staged upload of {file_name} has expired.")
+        fingerprint = fingerprint or get_document_fingerprint(file_data)
+        if not file_name.lower().endswith(".pdf"):
+            file_stream = io.BytesIO(file_data)
+            file_stream.name = file_name
+            file_data = convert_office_to_pdf(file_stream).getvalue()
+            stage_upload(session_id, doc_id, file_data)
+
+        pdf_document = fitz.open(stream=file_data, filetype="pdf")
+        try:
+            total_pages = len(pdf_document)
+            with llm_lane(session_id):
+                system_prompt = prepare_system_prompt(pdf_document, session_id=session_id)
+        finally:
+            pdf_document.close()
+        progress_key = get_progress_key(session_id, doc_id)
+        redis_client.hset(progress_key, "total", total_pages)
+        redis_client.expire(progress_key, UPLOAD_TTL)
+
+    except DocumentTooLargeError:
+        redis_client.delete(get_upload_key(session_id, doc_id))
+        return {"status": "too_large"}
     except Exception as e:
         logging.error(f"Failed to process PDF: {e}")
-        self.retry(exc=e, countdown=5)
+        raise self.retry(exc=e, countdown=5)
+
+    # Checked after the total is stored, so cancel_ingest revokes every batch it missed here.
+    if is_ingest_cancelled(session_id, doc_id):
+        return {"status": "cancelled"}
+    batch_tasks = [
+        process_page_batch_task.si(
+            session_id, doc_id, batch.start, batch.stop, system_prompt
+        ).set(task_id=get_batch_task_id(doc_id, batch.start))
+        for batch in get_page_batches(total_pages)
+    ]
+    assemble_task = assemble_document_task.si(session_id, doc_id, file_name, fingerprint)
+    workflow = chord(batch_tasks, assemble_task) if batch_tasks else assemble_task
+    if self.request.is_eager:
+        # Eager runs have no worker to hand the graph to, so run it inline.
+        with allow_join_result():
+            return workflow.apply().get()
+    return self.replace(workflow)
+
+
+@app.task(bind=True, max_retries=3)
+def process_page_batch_task(self, session_id, doc_id, start, stop, system_prompt):
+    """Process one page range of a staged document, skipping pages already stored."""
+    try:
+        if is_ingest_cancelled(session_id, doc_id):
+            return 0
+        stored_pages = {
+            int(page_number)
+            for page_number in redis_client.hkeys(f"{session_id}:document_pages:{doc_id}")
+        }
+        pending = [
+            page_number
+            for page_number in range(start, stop)
+            if page_number + 1 not in stored_pages
+        ]
+        if not pending:
+            return stop - start
+
+        def on_page(page_data):
+            if is_ingest_cancelled(session_id, doc_id):
+                return
+            save_page_to_redis(session_id, doc_id, page_data)
+            report_progress(session_id, doc_id)
+
+        file_data = redis_client.get(get_upload_key(session_id, doc_id))
+        pdf_document = fitz.open(stream=file_data, filetype="pdf")
+        # Thread and solo worker pools can use the extraction processes; prefork
+        # children are daemonic, so get_extraction_pool() returns None there.
+        shared_file = (
+            shared_pdf_file(file_data) if get_extraction_pool() is not None else nullcontext()
+        )
+        try:
+            with shared_file as pdf_path, llm_lane(session_id):
+                process_page_batch(
+                    pdf_document, pending, system_prompt, on_page=on_page, pdf_path=pdf_path
+                )
+        finally:
+            pdf_document.close()
+        return stop - start
+
+    except Exception as e:
+        logging.error(f"Failed to process pages {start + 1}-{stop} of {doc_id}: {e}")
+        raise self.retry(exc=e, countdown=5)
+
+
+@app.task(bind=True, max_retries=3)
+def assemble_document_task(self, session_id, doc_id, file_name, fingerprint):
+    """Reassemble the processed pages of a document, store it once under its
+    content fingerprint and link it into the session."""
+    try:
+        if is_ingest_cancelled(session_id, doc_id):
+            return {"status": "cancelled"}
+        document_data = {
+            "document_name": file_name,
+            "pages": load_pages_from_redis(session_id, doc_id),
+        }
+        system_prompt = redis_client.get(f"{session_id}:system_prompt")
+        with llm_lane(session_id):
+            finalize_document(
+                document_data, system_prompt.decode("utf-8") if system_prompt else None
+            )
+        save_document(SHARED_NAMESPACE, fingerprint, document_data)
+        link_document(session_id, doc_id, fingerprint, file_name)
+        redis_client.delete(
+            get_upload_key(session_id, doc_id),
+            get_progress_key(session_id, doc_id),
+            f"{session_id}:document_pages:{doc_id}",
+        )
+        return {"status": "done", "pages": len(document_data["pages"])}
+
+    except Exception as e:
+        logging.error(f"Failed to assemble document {file_name}: {e}")
+        raise self.retry(exc=e, countdown=5)
+
+
+@app.task
+def release_expired_sessions_task():
+    """Periodic sweep that releases the document references of abandoned sessions."""
+    return release_expired_sessions()
@@ -1,12 +1,19 @@
 import requests
-from utils.config import azure_endpoint, api_key, api_version, model
+from utils.config import model, retrieval_top_k, retrieval_rerank, lexical_candidates
+from utils.llm_client import post_chat_completion, stream_chat_completion
+from utils.llm_scheduler import submit_in_lane
+from utils.embeddings import search_embedding_indexes
+from utils.summarizer import summarize_documents
+from utils.intent_classifier import classify_intent
+from utils.tokens import count_tokens, get_document_tokens
+from utils.document_repository import fetch_pages
+from utils.lexical_index import LexicalIndex, build_lexical_index, search_lexical_indexes
 import logging
 import time
 import random
 import re
 import nltk
 from nltk.corpus import stopwords
-import tiktoken
 import concurrent.futures
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import NMF
@@ -16,14 +23,6 @@ logging.basicConfig(
 )
 nltk.download("stopwords", quiet=True)
 
-HEADERS = {"Content-Type": "application/json", "api-key": api_key}
-
-
-def count_tokens(text, model="gpt-4o"):
-    encoding = tiktoken.encoding_for_model(model)
-    tokens = encoding.encode(text)
-    return len(tokens)
-
 
 def preprocess_text(text):
     text = text.lower()
@@ -35,64 +34,6 @@ def preprocess_text(text):
     return text
 
 
-def is_summary_request(question):
-    summary_check_prompt = f"""
-        The user asked the question: {question}
-        
-        Determine if this question is about requesting a complete summary of the entire document, tell about the document or any request similar to that.
-        Answer "yes" or "no".
-        """
-    response = requests.post(
-        f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-        headers=HEADERS,
-        json={
-            "model": model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an assistant that detects summary requests.",
-                },
-                {"role": "user", "content": summary_check_prompt},
-            ],
-            "temperature": 0.0,
-        },
-    )
-    return (
-        response.json()
-        .get("choices", [{}])[0]
-        .get("message", {})
-        .get("content", "no")
-        .strip()
-        .lower()
-        == "yes"
-    )
-    
-def bing_search_topics(text, max_topics=1, max_top_words=10):
-    try:
-        
-        max_features = min(1000, len(text.split()))
-        vectorizer = TfidfVectorizer(stop_words="english", max_features=max_features)
-        tfidf = vectorizer.fit_transform([text])
-
-        
-        n_topics = min(max_topics, tfidf.shape[1])
-        nmf = NMF(n_components=n_topics, random_state=42, max_iter=500)
-        nmf.fit(tfidf)
-
-        feature_names = vectorizer.get_feature_names_out()
-
-        
-        n_top_words = min(max_top_words, len(feature_names))
-        topics = [
-            ", ".join([feature_names[i] for i in topic.argsort()[-n_top_words:][::-1]])
-            for topic in nmf.components_
-        ]
-        return " | ".join(topics)
-    except Exception as e:
-        print(f"Error extracting topics: {e}")
-        return "Error extracting topics."
-
-
 def extract_topics_from_text(text, max_topics=50, max_top_words=50):
     try:
         
@@ -120,11 +61,14 @@ def extract_topics_from_text(text, max_topics=50, max_top_words=50):
 
 
 
-def check_page_relevance(doc_name, page, preprocessed_question):
-    page_full_text = page.get("full_text", "No full text available")
-    page_summary = page.get("text_summary", "No summary available for this page")
-    extracted_topics = extract_topics_from_text(page_full_text, 50, 50)
+def get_page_summary(page):
+    summary = page.get("text_summary", "No summary available for this page")
+    if page.get("section_context"):
+        return f"Section context: {page['section_context']}\n{summary}"
+    return summary
+
 
+def get_page_reference(doc_name, page):
     image_explanation = (
         "\n".join(
             f"Page {img['page_number']}: {img['explanation']}"
@@ -132,6 +76,19 @@ def check_page_relevance(doc_name, page, preprocessed_question):
         )
         or "No image analysis."
     )
+    return {
+        "doc_name": doc_name,
+        "page_number": page["page_number"],
+        "page_summary": get_page_summary(page),
+        "image_explanation": image_explanation,
+    }
+
+
+def check_page_relevance(doc_name, page, preprocessed_question):
+    page_full_text = page.get("full_text", "No full text available")
+    extracted_topics = extract_topics_from_text(page_full_text, 50, 50)
+    page_reference = get_page_reference(doc_name, page)
+    image_explanation = page_reference["image_explanation"]
 
     relevance_check_prompt = f"""Here's the extracted topics and image analysis of a page:
 
@@ -158,12 +115,7 @@ def check_page_relevance(doc_name, page, preprocessed_question):
 
     for attempt in range(5):
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=HEADERS,
-                json=relevance_data,
-                timeout=60,
-            )
+            response = post_chat_completion(relevance_data, timeout=60)
             response.raise_for_status()
             relevance_answer = (
                 response.json()
@@ -174,12 +126,7 @@ def check_page_relevance(doc_name, page, preprocessed_question):
                 .lower()
             )
             if relevance_answer == "yes":
-                return {
-                    "doc_name": doc_name,
-                    "page_number": page["page_number"],
-                    "page_summary": page_summary,
-                    "image_explanation": image_explanation,
-                }
+                return page_reference
 
         except requests.exceptions.RequestException as e:
             logging.error(
@@ -192,256 +139,111 @@ def check_page_relevance(doc_name, page, preprocessed_question):
     return None
 
 
-def summarize_pages_in_batches(pages, batch_size=10):
-    summaries = []
-    for i in range(0, len(pages), batch_size):
-        batch_pages = pages[i : i + batch_size]
-        combined_batch_text = "\n".join(
-            f"Page {page['page_number']}, Full Text: {page.get('full_text', '')}\nImage Explanation: {page.get('image_explanation', '')}"
-            for page in batch_pages
-        )
-
-        
-        vectorizer = TfidfVectorizer(stop_words="english")
-        tfidf_matrix = vectorizer.fit_transform(
-            [page.get("full_text", "") for page in batch_pages]
-        )
-        nmf_model = NMF(n_components=3, random_state=42)
-        nmf_topics = nmf_model.fit_transform(tfidf_matrix)
+def get_lexical_index(doc_data):
+    """The document's LexicalIndex; documents stored without one get it built once."""
+    stored = doc_data.get("lexical_index")
+    if stored is None:
+        stored = doc_data["lexical_index"] = build_lexical_index(doc_data)
+    return stored if isinstance(stored, LexicalIndex) else LexicalIndex.from_dict(stored)
 
-        
-        topic_terms = []
-        for topic_idx, topic in enumerate(nmf_model.components_):
-            topic_terms.append(
-                [
-                    vectorizer.get_feature_names_out()[i]
-                    for i in topic.argsort()[: -5 - 1 : -1]
-                ]
-            )
 
-        all_prominent_terms = [term for sublist in topic_terms for term in sublist]
-
-        batch_summary_prompt = f"""
-                Summarize the following content concisely while retaining the key points and mention range of pages given as input:
-                Additionally, ensure that the summary reflects the following prominent terms derived from the content:
-                Present the summary in a proper human readable format using subheadings and bullets wherever necessary. Don't mention as summary:
-                {', '.join(all_prominent_terms)}
-
-                {combined_batch_text}
-                """
-        batch_summary_data = {
-            "model": model,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an assistant that creates concise summaries.",
-                },
-                {"role": "user", "content": batch_summary_prompt},
-            ],
-            "temperature": 0.0,
-        }
+def get_lexical_candidates(documents, question):
+    indexes = {
+        doc_name: get_lexical_index(doc_data) for doc_name, doc_data in documents.items()
+    }
+    hits = search_lexical_indexes(indexes, question, lexical_candidates)
+    return [(doc_name, page_number) for doc_name, page_number, _ in hits] or None
 
-        for attempt in range(5):
-            try:
-                response = requests.post(
-                    f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                    headers=HEADERS,
-                    json=batch_summary_data,
-                    timeout=60,
-                )
-                response.raise_for_status()
-                batch_summary = (
-                    response.json()
-                    .get("choices", [{}])[0]
-                    .get("message", {})
-                    .get("content", "")
-                    .strip()
-                )
-                summaries.append(batch_summary)
-                break
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Error summarizing batch starting at page {i}: {e}")
-                backoff_time = (2**attempt) + random.uniform(0, 1)
-                time.sleep(backoff_time)
-
-    return "\n\n".join(summaries)
-
-
-def is_detailed_summary_request(question):
-    headers = HEADERS
-    
-    intent_prompt = f"""
-    You are an assistant that classifies user intents. The user's question will be provided, 
-    and you must determine if the question explicitly asks for a detailed summary, 
-    pagewise summary, topic-wise summary any request similar to that. 
 
-    User's question: {question}
+def select_relevant_pages(documents, question, preprocessed_question):
+    """Rank candidate pages by (doc_name, page_number) first, then fetch only those pages.
 
-    Respond with only "yes" or "no".
+    Documents with an embedding index are ranked by it, within their lexical
+    candidates. Documents without one, such as ones still being ingested, fall
+    back to their lexical candidates, and only when there are none to a
+    relevance check of each of their pages.
     """
-
-    
-    data = {
-        "model": model,
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant that classifies intents.",
-            },
-            {"role": "user", "content": intent_prompt},
-        ],
-        "temperature": 0.0,
+    lexical_keys = get_lexical_candidates(documents, question) or []
+    unindexed = {
+        doc_name
+        for doc_name, doc_data in documents.items()
+        if not doc_data.get("embedding_index")
     }
+    indexed_lexical_keys = {key for key in lexical_keys if key[0] not in unindexed}
+    ranked_keys = search_embedding_indexes(
+        documents, question, retrieval_top_k, indexed_lexical_keys or None
+    )
+    if ranked_keys is None:
+        # Nothing is indexed or the question could not be embedded.
+        unindexed = set(documents)
+        ranked_keys = []
+    fallback_keys = [key for key in lexical_keys if key[0] in unindexed]
+
+    pages = fetch_pages(documents, ranked_keys + fallback_keys)
+    ranked = [(key[0], pages[key]) for key in ranked_keys if key in pages]
+    candidates = [(key[0], pages[key]) for key in fallback_keys if key in pages]
+    ranked_references = []
+    if retrieval_rerank:
+        candidates = ranked + candidates
+    else:
+        ranked_references = [get_page_reference(doc_name, page) for doc_name, page in ranked]
+    if not fallback_keys:
+        candidates += [
+            (doc_name, page)
+            for doc_name, doc_data in documents.items()
+            if doc_name in unindexed
+            for page in doc_data["pages"]
+        ]
+    # A scan of every page with no ranked candidates runs one check at a time.
+    max_workers = 1 if not ranked_keys and not fallback_keys else None
+
+    relevant_pages = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_rank = {
+            submit_in_lane(
+                executor, check_page_relevance, doc_name, page, preprocessed_question
+            ): rank
+            for rank, (doc_name, page) in enumerate(candidates)
+        }
 
-    try:
-        
-        response = requests.post(
-            f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-            headers=headers,
-            json=data,
-            timeout=60,
-        )
-        response.raise_for_status()
-        return (
-            response.json()
-            .get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "no")
-            .strip()
-            .lower()
-            == "yes"
-        )
-        
+        for future in concurrent.futures.as_completed(future_to_rank):
+            result = future.result()
+            if result:
+                relevant_pages[future_to_rank[future]] = result
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error determining intent: {e}")
-        return False
+    return ranked_references + [relevant_pages[rank] for rank in sorted(relevant_pages)]
 
 
-def ask_question(documents, question, chat_history):
-    headers = HEADERS
+def prepare_answer(documents, question, chat_history):
+    """Route a question and build its final answer request.
+
+    Returns (answer, final_data, total_tokens). Summaries and questions with no
+    relevant pages are answered directly and final_data is None; otherwise
+    answer is None and final_data is the chat-completion payload to send.
+    """
     preprocessed_question = preprocess_text(question)
 
     
-    if is_summary_request(preprocessed_question):
+    intent = classify_intent(question)
+    if intent != "question":
         
-        if not is_detailed_summary_request(preprocessed_question):
-
-            
-            combined_text = "\n".join(
-                page.get("full_text", "")
-                for doc_data in documents.values()
-                for page in doc_data["pages"]
-            )
-
-            
-            vectorizer = TfidfVectorizer(stop_words="english")
-            tfidf_matrix = vectorizer.fit_transform([combined_text])
-            nmf_model = NMF(n_components=5, random_state=1)
-            nmf_topics = nmf_model.fit_transform(tfidf_matrix)
-
-            
-            topic_terms = []
-            for topic_idx, topic in enumerate(nmf_model.components_):
-                topic_terms.append(
-                    [
-                        vectorizer.get_feature_names_out()[i]
-                        for i in topic.argsort()[:-6:-1]
-                    ]
-                )
-
-            
-            all_prominent_terms = [term for sublist in topic_terms for term in sublist]
-
-            
-            def get_page_topic_relevance(page_text):
-                page_vectorized = vectorizer.transform([page_text])
-                topic_scores = nmf_model.transform(page_vectorized)
-                return sum(topic_scores[0])
-
-            
-            relevant_page_summaries = [
-                page.get("text_summary", "")
-                for doc_name, doc_data in documents.items()
-                for page in doc_data["pages"]
-                if get_page_topic_relevance(page.get("full_text", "")) > 0
-            ]
-
-            
-            combined_summary_prompt = f"""
-            Combine the following summaries into a single, comprehensive summary of the document.
-            Provide line or paragraph number attribution Wherever present.
-            Ensure the summary is thorough yet concise, presenting the key points in a structured, readable format using subheaders and bullets that highlight major themes and strategies:
-
-            {' '.join(relevant_page_summaries)}
-            """
-
-            
-            final_summary_data = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are an assistant that creates a document summary.",
-                    },
-                    {"role": "user", "content": combined_summary_prompt},
-                ],
-                "temperature": 0.0,
-            }
-
-            
-            final_response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=final_summary_data,
-            )
-            final_summary = (
-                final_response.json()
-                .get("choices", [{}])[0]
-                .get("message", {})
-                .get("content", "No summary provided.")
-            )
-
-            total_tokens = count_tokens(combined_summary_prompt)
-
-            return final_summary, total_tokens
-
-        else:
-            
-            all_pages = [
-                page for doc_data in documents.values() for page in doc_data["pages"]
-            ]
-            final_summary = summarize_pages_in_batches(all_pages)
-            total_tokens = count_tokens(str(all_pages))
-            return final_summary, total_tokens
+        answer, total_tokens = summarize_documents(
+            documents, detailed=intent == "detailed_summary"
+        )
+        return answer, None, total_tokens
 
     
-    total_tokens = count_tokens(preprocessed_question)
-
-    for doc_name, doc_data in documents.items():
-        for page in doc_data["pages"]:
-            total_tokens += count_tokens(page.get("full_text", ""))
-            total_tokens += count_tokens(page.get("image_explanation", ""))
+    total_tokens = count_tokens(preprocessed_question) + sum(
+        get_document_tokens(doc_data) for doc_data in documents.values()
+    )
 
     if total_tokens > 50000:
-        relevant_pages = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future_to_page = {
-                executor.submit(
-                    check_page_relevance, doc_name, page, preprocessed_question
-                ): (doc_name, page, preprocessed_question)
-                for doc_name, doc_data in documents.items()
-                for page in doc_data["pages"]
-            }
-
-            for future in concurrent.futures.as_completed(future_to_page):
-                result = future.result()
-                if result:
-                    relevant_pages.append(result)
+        relevant_pages = select_relevant_pages(documents, question, preprocessed_question)
 
         if not relevant_pages:
             return (
                 "The content of the provided documents does not contain an answer to your question.",
+                None,
                 total_tokens,
             )
 
@@ -453,7 +255,7 @@ def ask_question(documents, question, chat_history):
 
     else:
         relevant_pages_content = "\n".join(
-            f"Document: {doc_data['document_name']}, Page {page['page_number']}\nSummary: {page['text_summary']}\nImage Analysis: {', '.join([analysis['explanation'] for analysis in page['image_analysis']])}"
+            f"Document: {doc_data['document_name']}, Page {page['page_number']}\nSummary: {get_page_summary(page)}\nImage Analysis: {', '.join([analysis['explanation'] for analysis in page['image_analysis']])}"
             for doc_name, doc_data in documents.items()
             for page in doc_data["pages"]
         )
@@ -499,15 +301,17 @@ def ask_question(documents, question, chat_history):
         ],
         "temperature": 0.0,
     }
+    return None, final_data, count_tokens(prompt_message)
+
+
+def ask_question(documents, question, chat_history):
+    answer, final_data, total_tokens = prepare_answer(documents, question, chat_history)
+    if final_data is None:
+        return answer, total_tokens
 
     for attempt in range(5):
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=final_data,
-                timeout=60,
-            )
+            response = post_chat_completion(final_data, timeout=60)
             response.raise_for_status()
             answer_content = (
                 response.json()
@@ -517,7 +321,6 @@ def ask_question(documents, question, chat_history):
                 .strip()
             )
 
-            total_tokens = count_tokens(prompt_message)
             return answer_content, total_tokens
 
         except requests.exceptions.RequestException as e:
@@ -526,3 +329,35 @@ def ask_question(documents, question, chat_history):
             time.sleep(backoff_time)
 
     return "Error processing question.", total_tokens
+
+
+def stream_answer(final_data, question, retries=5):
+    """Yield the answer as it streams; retries only until the first delta arrives."""
+    for attempt in range(retries):
+        started = False
+        try:
+            for content in stream_chat_completion(final_data, timeout=60):
+                started = True
+                yield content
+            return
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.error(f"Error streaming answer to '{question}': {e}")
+            if started:
+                yield "\n\nError: the answer was interrupted."
+                return
+            time.sleep((2**attempt) + random.uniform(0, 1))
+
+    yield "Error processing question."
+
+
+def ask_question_stream(documents, question, chat_history):
+    """Streaming variant of ask_question: returns (answer chunks, total_tokens).
+
+    Routing and retrieval run before this returns; the chunks generator then
+    issues the final completion with stream=true, so consume it in the same
+    llm_lane as the call.
+    """
+    answer, final_data, total_tokens = prepare_answer(documents, question, chat_history)
+    if final_data is None:
+        return iter([answer]), total_tokens
+    return stream_answer(final_data, question), total_tokens
@@ -15,3 +15,35 @@ azure_blob_connection_string = os.getenv("BLOB_CONNECTION_STRING")
 azure_container_name = os.getenv("BLOB_CONTAINER_NAME")
 bing_key = os.getenv("BING_KEY")
 bing_endpoint = os.getenv("BING_ENDPOINT")
+page_cache_ttl = int(os.getenv("PAGE_CACHE_TTL", 7 * 24 * 3600))
+page_cache_max_entries = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", 50000))
+page_cache_path = os.getenv("PAGE_CACHE_PATH", "page_cache.sqlite3")
+llm_pool_size = int(os.getenv("LLM_POOL_SIZE", 16))
+llm_requests_per_minute = int(os.getenv("LLM_RPM", 300))
+llm_tokens_per_minute = int(os.getenv("LLM_TPM", 150000))
+llm_rate_limit_retries = int(os.getenv("LLM_RATE_LIMIT_RETRIES", 5))
+embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", 20))
+retrieval_rerank = os.getenv("RETRIEVAL_RERANK", "true").lower() == "true"
+lexical_candidates = int(os.getenv("LEXICAL_CANDIDATES", 50))
+summary_mode = os.getenv("SUMMARY_MODE", "sequential").lower()
+summary_section_pages = int(os.getenv("SUMMARY_SECTION_PAGES", 5))
+extraction_workers = int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1))
+vision_image_format = os.getenv("VISION_IMAGE_FORMAT", "jpeg").lower()
+vision_image_quality = int(os.getenv("VISION_IMAGE_QUALITY", 75))
+vision_batch_max_images = int(os.getenv("VISION_BATCH_MAX_IMAGES", 1))
+vision_batch_max_tokens = int(os.getenv("VISION_BATCH_MAX_TOKENS", 3000))
+summary_pack_page_tokens = int(os.getenv("SUMMARY_PACK_PAGE_TOKENS", 200))
+summary_pack_max_tokens = int(os.getenv("SUMMARY_PACK_MAX_TOKENS", 2000))
+summary_section_tokens = int(os.getenv("SUMMARY_SECTION_TOKENS", 6000))
+summary_fan_in = int(os.getenv("SUMMARY_FAN_IN", 8))
+precompute_document_summary = (
+    os.getenv("PRECOMPUTE_DOCUMENT_SUMMARY", "true").lower() == "true"
+)
+intent_confidence_threshold = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", 0.6))
+intent_llm_fallback = os.getenv("INTENT_LLM_FALLBACK", "true").lower() == "true"
+web_search_deadline = float(os.getenv("WEB_SEARCH_DEADLINE", 3))
+web_search_cache_ttl = int(os.getenv("WEB_SEARCH_CACHE_TTL", 24 * 60 * 60))
+document_cache_bytes = int(os.getenv("DOCUMENT_CACHE_MB", 256)) * 1024 * 1024
+document_ttl = int(os.getenv("DOCUMENT_TTL", 7 * 24 * 60 * 60))
+session_ttl = int(os.getenv("SESSION_TTL", 7 * 24 * 60 * 60))
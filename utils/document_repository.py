@@ -0,0 +1,309 @@
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Mapping
+from utils.config import document_cache_bytes, document_ttl, session_ttl
+from utils.document_store import (
+    decode_manifest,
+    expire_document,
+    get_document_keys,
+    load_extra,
+    load_manifest,
+    load_pages,
+)
+from utils.redis_client import redis_client
+
+# Processed documents are stored once per content fingerprint under this
+# namespace; sessions link to them by doc_id.
+SHARED_NAMESPACE = "shared"
+# Sorted set of session ids scored by when each was last seen.
+SESSIONS_KEY = "sessions:last_seen"
+
+# Maps cache keys to (value, size); _cache_size is the sum of the sizes.
+_cache = OrderedDict()
+_cache_size = 0
+_cache_lock = threading.Lock()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key][0]
+    return None
+
+
+def _cache_set(key, value, size):
+    """Cache value as size bytes, evicting the least recently used entries.
+
+    Values larger than the whole budget are not cached at all.
+    """
+    global _cache_size
+    if size > document_cache_bytes:
+        return
+    with _cache_lock:
+        if key in _cache:
+            _cache_size -= _cache.pop(key)[1]
+        _cache[key] = (value, size)
+        _cache_size += size
+        while _cache_size > document_cache_bytes:
+            _cache_size -= _cache.popitem(last=False)[1][1]
+
+
+def get_links_key(session_id):
+    return f"{session_id}:document_links"
+
+
+def get_refs_key(fingerprint):
+    return f"{SHARED_NAMESPACE}:document_refs:{fingerprint}"
+
+
+def get_session_keys(session_id):
+    return [get_links_key(session_id), f"{session_id}:system_prompt"]
+
+
+def get_page_cache_key(session_id, doc_id, page_number):
+    return (session_id, doc_id, "page", page_number)
+
+
+def forget_document(session_id, doc_id):
+    """Drop a document's cached pages and extras from this process."""
+    global _cache_size
+    with _cache_lock:
+        for key in [key for key in _cache if key[:2] == (session_id, doc_id)]:
+            _cache_size -= _cache.pop(key)[1]
+
+
+class LazyDocument(Mapping):
+    """Read-only view of a stored document that loads its parts on first access.
+
+    session_id and doc_id locate the document in the store; for linked
+    documents they are SHARED_NAMESPACE and the content fingerprint, so the
+    cache is shared by every session holding the same file. Only the manifest
+    is held by the instance. Single pages and the extras (embedding index,
+    lexical index, document summary) are fetched from the document store and
+    kept in a process-wide LRU shared by every session. The LRU is bounded by
+    the uncompressed size of the stored records, so a web process holds at
+    most about DOCUMENT_CACHE_MB of them however many sessions it serves. Values assigned to it stay local to the instance.
+    """
+
+    def __init__(self, session_id, doc_id, manifest):
+        self.session_id = session_id
+        self.doc_id = doc_id
+        self.manifest = manifest
+        self.overrides = {}
+
+    def _load_extra(self, key):
+        cache_key = (self.session_id, self.doc_id, key)
+        value = _cache_get(cache_key)
+        if value is None:
+            value, size = load_extra(
+                self.session_id, self.doc_id, key, with_size=True
+            )
+            _cache_set(cache_key, value, size)
+        return value
+
+    def get_pages(self, page_numbers=None):
+        """The given pages, or every page, ordered by page number."""
+        if page_numbers is None:
+            page_numbers = range(1, self.manifest["page_count"] + 1)
+        pages = fetch_pages({self.doc_id: self}, [(self.doc_id, n) for n in page_numbers])
+        return [pages[key] for key in sorted(pages)]
+
+    def _manifest_keys(self):
+        keys = ["document_name", "page_count", "image_stats"]
+        if self.manifest.get("tokens") is not None:
+            keys.append("tokens")
+        return keys
+
+    def __getitem__(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        if key in self._manifest_keys():
+            return self.manifest[key]
+        if key == "pages":
+            return self.get_pages()
+        if key in self.manifest["extras"]:
+            return self._load_extra(key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.overrides[key] = value
+
+    def __iter__(self):
+        keys = [*self._manifest_keys(), "pages", *self.manifest["extras"]]
+        return iter(dict.fromkeys([*keys, *self.overrides]))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def fetch_pages(documents, page_keys):
+    """Fetch only the pages named by (doc_name, page_number) keys.
+
+    Pages of LazyDocuments come from the process-wide LRU, and the ones it
+    lacks are read with one pipelined load_pages call per store namespace;
+    documents still being ingested are plain dicts whose pages are already
+    in memory. Returns {(doc_name, page_number): page} for the keys that exist.
+    """
+    pages = {}
+    requested = {}
+    in_memory = {}
+    for doc_name, page_number in page_keys:
+        doc_data = documents.get(doc_name)
+        if isinstance(doc_data, LazyDocument):
+            page = _cache_get(
+                get_page_cache_key(doc_data.session_id, doc_data.doc_id, page_number)
+            )
+            if page is not None:
+                pages[(doc_name, page_number)] = page
+                continue
+            requested.setdefault(doc_data.session_id, {}).setdefault(
+                doc_data.doc_id, {}
+            ).setdefault(page_number, []).append(doc_name)
+        elif doc_data is not None:
+            if doc_name not in in_memory:
+                in_memory[doc_name] = {
+                    page["page_number"]: page for page in doc_data["pages"]
+                }
+            if page_number in in_memory[doc_name]:
+                pages[(doc_name, page_number)] = in_memory[doc_name][page_number]
+
+    for namespace, stored in requested.items():
+        loaded = load_pages(
+            namespace,
+            {doc_id: list(numbers) for doc_id, numbers in stored.items()},
+            with_sizes=True,
+        )
+        for doc_id, doc_pages in loaded.items():
+            for page, size in doc_pages:
+                _cache_set(
+                    get_page_cache_key(namespace, doc_id, page["page_number"]),
+                    page,
+                    size,
+                )
+                for doc_name in stored[doc_id][page["page_number"]]:
+                    pages[(doc_name, page["page_number"])] = page
+    return pages
+
+
+def find_document(fingerprint):
+    """Manifest of an already processed document with this fingerprint, or None."""
+    return load_manifest(SHARED_NAMESPACE, fingerprint)
+
+
+def link_document(session_id, doc_id, fingerprint, name):
+    """Attach a processed document to a session and count the reference.
+
+    Documents nobody references are left to expire; linking keeps them again.
+    """
+    link = json.dumps({"fingerprint": fingerprint, "name": name})
+    if redis_client.hsetnx(get_links_key(session_id), doc_id, link):
+        redis_client.incr(get_refs_key(fingerprint))
+        redis_client.persist(get_refs_key(fingerprint))
+        expire_document(SHARED_NAMESPACE, fingerprint, None)
+    touch_session(session_id)
+
+
+def unlink_document(session_id, doc_id):
+    """Detach a document from a session; the last reference starts its TTL."""
+    link = redis_client.hget(get_links_key(session_id), doc_id)
+    if link is None or not redis_client.hdel(get_links_key(session_id), doc_id):
+        return
+    fingerprint = json.loads(link)["fingerprint"]
+    if redis_client.decr(get_refs_key(fingerprint)) <= 0:
+        redis_client.expire(get_refs_key(fingerprint), document_ttl)
+        expire_document(SHARED_NAMESPACE, fingerprint, document_ttl)
+        forget_document(SHARED_NAMESPACE, fingerprint)
+        # A session may have linked it again while the TTL was being set.
+        if int(redis_client.get(get_refs_key(fingerprint)) or 0) > 0:
+            expire_document(SHARED_NAMESPACE, fingerprint, None)
+
+
+def touch_session(session_id):
+    """Record a visit: the session stays alive for another SESSION_TTL seconds.
+
+    Its keys also get a native TTL of twice that, as a backstop for when no
+    sweep runs; release_expired_sessions normally releases them first.
+    """
+    pipe = redis_client.pipeline()
+    pipe.zadd(SESSIONS_KEY, {session_id: time.time()})
+    for key in get_session_keys(session_id):
+        pipe.expire(key, 2 * session_ttl)
+    pipe.execute()
+
+
+def find_session(session_id):
+    """The canonical id of a live session, or None.
+
+    Ids from the URL must be well-formed random UUIDs of a session seen within
+    SESSION_TTL, so a made-up or expired id never reopens any documents.
+    """
+    try:
+        parsed = uuid.UUID(session_id)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    if parsed.version != 4:
+        return None
+    session_id = str(parsed)
+    last_seen = redis_client.zscore(SESSIONS_KEY, session_id)
+    if last_seen is None or last_seen <= time.time() - session_ttl:
+        return None
+    return session_id
+
+
+def release_session(session_id):
+    """Unlink every document of a session, releasing its references, and drop its keys."""
+    for doc_id in redis_client.hkeys(get_links_key(session_id)):
+        unlink_document(session_id, doc_id.decode("utf-8"))
+    redis_client.delete(*get_session_keys(session_id))
+    redis_client.zrem(SESSIONS_KEY, session_id)
+
+
+def release_expired_sessions(limit=100):
+    """Release up to limit sessions not seen for SESSION_TTL seconds; returns how many."""
+    cutoff = time.time() - session_ttl
+    released = 0
+    for session_id in redis_client.zrangebyscore(
+        SESSIONS_KEY, "-inf", cutoff, start=0, num=limit
+    ):
+        # Skip sessions visited again since the range was read.
+        if (redis_client.zscore(SESSIONS_KEY, session_id) or 0) > cutoff:
+            continue
+        release_session(session_id.decode("utf-8"))
+        released += 1
+    return released
+
+
+def open_linked_document(link, manifest):
+    manifest = dict(manifest, document_name=link["name"])
+    return LazyDocument(SHARED_NAMESPACE, link["fingerprint"], manifest)
+
+
+def open_document(session_id, doc_id):
+    """A LazyDocument for a document linked to the session, or None."""
+    link = redis_client.hget(get_links_key(session_id), doc_id)
+    if link is None:
+        return None
+    link = json.loads(link)
+    manifest = find_document(link["fingerprint"])
+    return open_linked_document(link, manifest) if manifest else None
+
+
+def open_session_documents(session_id):
+    """Rehydrate every document linked to a session as LazyDocuments."""
+    links = {
+        doc_id.decode("utf-8"): json.loads(link)
+        for doc_id, link in redis_client.hgetall(get_links_key(session_id)).items()
+    }
+    pipe = redis_client.pipeline(transaction=False)
+    for link in links.values():
+        pipe.hgetall(get_document_keys(SHARED_NAMESPACE, link["fingerprint"])[0])
+    documents = {}
+    for (doc_id, link), fields in zip(links.items(), pipe.execute()):
+        manifest = decode_manifest(fields)
+        if manifest is not None:
+            documents[doc_id] = open_linked_document(link, manifest)
+    return documents
@@ -0,0 +1,160 @@
+import json
+import threading
+import msgpack
+import zstandard
+from utils.redis_client import redis_client
+from utils.tokens import get_document_tokens
+
+STORE_VERSION = 1
+COMPRESSION_LEVEL = 3
+WRITE_CHUNK_PAGES = 100
+EXTRA_FIELDS = ("embedding_index", "lexical_index", "document_summary")
+
+_codecs = threading.local()
+
+
+def _get_codecs():
+    # zstandard contexts must not be shared between threads.
+    if not hasattr(_codecs, "compressor"):
+        _codecs.compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+        _codecs.decompressor = zstandard.ZstdDecompressor()
+    return _codecs.compressor, _codecs.decompressor
+
+
+def pack_record(value):
+    return _get_codecs()[0].compress(msgpack.packb(value, use_bin_type=True))
+
+
+def unpack_record(data):
+    return msgpack.unpackb(
+        _get_codecs()[1].decompress(data), raw=False, strict_map_key=False
+    )
+
+
+def get_record_size(data):
+    """Uncompressed size of a stored record, read from its zstd frame header."""
+    size = zstandard.frame_content_size(data)
+    return size if size >= 0 else len(data)
+
+
+def get_document_keys(session_id, doc_id):
+    """(manifest, pages, extras) keys of a stored document."""
+    prefix = f"{session_id}:document:{doc_id}"
+    return f"{prefix}:manifest", f"{prefix}:pages", f"{prefix}:extras"
+
+
+def decode_manifest(fields):
+    if not fields:
+        return None
+    fields = {key.decode("utf-8"): value.decode("utf-8") for key, value in fields.items()}
+    return {
+        "document_name": fields["document_name"],
+        "page_count": int(fields["page_count"]),
+        "image_stats": json.loads(fields.get("image_stats") or "{}"),
+        "tokens": int(fields["tokens"]) if "tokens" in fields else None,
+        "extras": [name for name in fields.get("extras", "").split(",") if name],
+        "version": int(fields["version"]),
+    }
+
+
+def save_document(session_id, doc_id, document_data, client=redis_client):
+    """Store a processed document as a manifest plus compressed per-page records.
+
+    The manifest is a small hash of plain fields. Pages are msgpack + zstd
+    records in one hash keyed by page number, and the embedding index and
+    document summary sit in a separate hash so reading pages never pulls
+    them. Everything is written in one MULTI/EXEC pipeline.
+    """
+    manifest_key, pages_key, extras_key = get_document_keys(session_id, doc_id)
+    pages = document_data["pages"]
+    pipe = client.pipeline()
+    pipe.delete(manifest_key, pages_key, extras_key)
+    for start in range(0, len(pages), WRITE_CHUNK_PAGES):
+        pipe.hset(
+            pages_key,
+            mapping={
+                page["page_number"]: pack_record(page)
+                for page in pages[start : start + WRITE_CHUNK_PAGES]
+            },
+        )
+    extras = {
+        name: pack_record(document_data[name])
+        for name in EXTRA_FIELDS
+        if document_data.get(name) is not None
+    }
+    if extras:
+        pipe.hset(extras_key, mapping=extras)
+    pipe.hset(
+        manifest_key,
+        mapping={
+            "document_name": document_data["document_name"],
+            "page_count": len(pages),
+            "image_stats": json.dumps(document_data.get("image_stats", {})),
+            "tokens": get_document_tokens(document_data),
+            "extras": ",".join(extras),
+            "version": STORE_VERSION,
+        },
+    )
+    pipe.execute()
+
+
+def load_manifest(session_id, doc_id, client=redis_client):
+    """The stored document's manifest, or None if it is not stored."""
+    return decode_manifest(client.hgetall(get_document_keys(session_id, doc_id)[0]))
+
+
+def load_pages(session_id, requested_pages, client=redis_client, with_sizes=False):
+    """Fetch pages of several documents in one pipelined round trip.
+
+    requested_pages maps doc_id to a list of page numbers, or None for every
+    page. Returns {doc_id: [page, ...]} ordered by page number, skipping
+    pages that are not stored; with_sizes makes each item a (page, size)
+    pair, size being the page's uncompressed record length.
+    """
+    pipe = client.pipeline(transaction=False)
+    for doc_id, page_numbers in requested_pages.items():
+        pages_key = get_document_keys(session_id, doc_id)[1]
+        if page_numbers is None:
+            pipe.hgetall(pages_key)
+        else:
+            pipe.hmget(pages_key, list(page_numbers))
+    results = pipe.execute() if requested_pages else []
+
+    pages_by_doc = {}
+    for doc_id, records in zip(requested_pages, results):
+        if isinstance(records, dict):
+            records = records.values()
+        pages = sorted(
+            (
+                (unpack_record(record), get_record_size(record))
+                for record in records
+                if record is not None
+            ),
+            key=lambda item: item[0]["page_number"],
+        )
+        pages_by_doc[doc_id] = pages if with_sizes else [page for page, _ in pages]
+    return pages_by_doc
+
+
+def load_extra(session_id, doc_id, name, client=redis_client, with_size=False):
+    """One of EXTRA_FIELDS of a stored document, or None.
+
+    with_size returns a (value, size) pair, size being the uncompressed
+    record length (0 when the extra is not stored).
+    """
+    record = client.hget(get_document_keys(session_id, doc_id)[2], name)
+    value = unpack_record(record) if record is not None else None
+    if with_size:
+        return value, get_record_size(record) if record is not None else 0
+    return value
+
+
+def expire_document(session_id, doc_id, ttl, client=redis_client):
+    """Let a stored document expire after ttl seconds, or keep it again with ttl=None."""
+    pipe = client.pipeline()
+    for key in get_document_keys(session_id, doc_id):
+        if ttl is None:
+            pipe.persist(key)
+        else:
+            pipe.expire(key, ttl)
+    pipe.execute()
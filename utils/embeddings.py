@@ -0,0 +1,128 @@
+import base64
+import logging
+import random
+import time
+import numpy as np
+import requests
+from utils.llm_client import post_embeddings
+
+CHUNK_WORDS = 200
+CHUNK_OVERLAP = 40
+EMBEDDING_BATCH_SIZE = 64
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping word windows."""
+    words = text.split()
+    if not words:
+        return []
+    step = chunk_words - overlap
+    return [
+        " ".join(words[i : i + chunk_words])
+        for i in range(0, max(len(words) - overlap, 1), step)
+    ]
+
+
+def page_chunks(page):
+    """Chunks of a page's full text plus its image analysis."""
+    image_text = " ".join(
+        analysis.get("explanation", "") for analysis in page.get("image_analysis", [])
+    )
+    return chunk_text(f"{page.get('full_text', '')} {image_text}")
+
+
+def embed_texts(texts, retries=5):
+    """Embed texts in batches, returning an L2-normalized float32 matrix or None."""
+    vectors = []
+    for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = texts[i : i + EMBEDDING_BATCH_SIZE]
+        for attempt in range(retries):
+            try:
+                response = post_embeddings(batch, timeout=60)
+                response.raise_for_status()
+                data = sorted(response.json()["data"], key=lambda x: x["index"])
+                vectors.extend(item["embedding"] for item in data)
+                break
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                logging.error(f"Error embedding batch starting at chunk {i}: {e}")
+                if attempt == retries - 1:
+                    return None
+                time.sleep((2**attempt) + random.uniform(0, 1))
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def build_embedding_index(document_data):
+    """Embed every page chunk of a processed document into a msgpack-serializable index."""
+    page_numbers = []
+    texts = []
+    for page in document_data["pages"]:
+        for chunk in page_chunks(page):
+            page_numbers.append(page["page_number"])
+            texts.append(chunk)
+
+    if not texts:
+        return None
+
+    matrix = embed_texts(texts)
+    if matrix is None:
+        return None
+
+    return {
+        "page_numbers": page_numbers,
+        "dim": matrix.shape[1],
+        "vectors": matrix.tobytes(),
+    }
+
+
+def load_index_vectors(index):
+    """The vectors of an embedding index as a matrix.
+
+    The matrix is a view over the stored bytes, kept in the index itself so
+    it is decoded once for as long as the index stays cached.
+    """
+    matrix = index.get("matrix")
+    if matrix is None:
+        vectors = index["vectors"]
+        if isinstance(vectors, str):
+            # Indexes stored before the vectors were raw bytes.
+            vectors = base64.b64decode(vectors)
+        matrix = np.frombuffer(vectors, dtype=np.float32).reshape(-1, index["dim"])
+        index["matrix"] = matrix
+    return matrix
+
+
+def search_embedding_indexes(documents, question, top_k, page_filter=None):
+    """Rank pages of all documents by their best chunk similarity to the question.
+
+    Returns a list of (doc_name, page_number) keys, best first, or None when
+    no document has an index or the question cannot be embedded. Documents
+    without an index, e.g. ones still being ingested, are left out.
+    page_filter, a set of such keys, restricts the ranking to those pages.
+    """
+    indexes = {
+        doc_name: doc_data.get("embedding_index")
+        for doc_name, doc_data in documents.items()
+    }
+    indexes = {doc_name: index for doc_name, index in indexes.items() if index}
+    if not indexes:
+        return None
+
+    question_vector = embed_texts([question])
+    if question_vector is None:
+        return None
+
+    best_scores = {}
+    for doc_name, index in indexes.items():
+        scores = load_index_vectors(index) @ question_vector[0]
+        for page_number, score in zip(index["page_numbers"], scores):
+            key = (doc_name, page_number)
+            if page_filter is not None and key not in page_filter:
+                continue
+            if score > best_scores.get(key, -np.inf):
+                best_scores[key] = score
+
+    return sorted(best_scores, key=best_scores.get, reverse=True)[:top_k]
@@ -0,0 +1,159 @@
+import csv
+import logging
+import os
+import re
+import threading
+import requests
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import FeatureUnion, make_pipeline
+from utils.config import model, intent_confidence_threshold, intent_llm_fallback
+from utils.llm_client import post_chat_completion
+
+INTENTS = ("question", "summary", "detailed_summary")
+INTENT_DATA_PATH = os.path.join(os.path.dirname(__file__), "intent_questions.csv")
+
+DETAILED_SUMMARY_PATTERN = re.compile(
+    r"\b(page|section|chapter|topic|slide)s?[\s-]*(wise|by[\s-]*(page|section|chapter|topic|slide))\b"
+    r"|\bsummar(y|ise|ize)\s+(of\s+)?(each|every)\s+(page|section|chapter|slide)\b"
+    r"|^\s*(please\s+)?((can|could)\s+you\s+)?(give\s+me\s+|provide\s+|write\s+|i\s+(want|need)\s+)?(a\s+|an\s+)?"
+    r"(detailed|in[\s-]*depth|exhaustive)\s+(summary|overview|breakdown)"
+    r"(\s+(of\s+)?(this|the|these|both|all(\s+the)?)\s+(documents?|files?|pdfs?|reports?|papers?|contracts?|decks?|presentations?))?"
+    r"(\s+(for\s+me|please))?\s*[.?!]*\s*$",
+    re.IGNORECASE,
+)
+SUMMARY_PATTERN = re.compile(
+    r"^\s*(please\s+)?(summari[sz]e|sum\s+up|tl;?dr|(give\s+me\s+)?(a\s+|an\s+)?(brief\s+|quick\s+|short\s+)?(summary|overview))"
+    r"(\s+(of\s+)?(this|the|these|both|all(\s+the)?)\s+(documents?|files?|pdfs?|reports?|papers?|decks?|presentations?))?"
+    r"(\s+(for\s+me|please))?\s*[.?!]*\s*$"
+    r"|\bwhat('s|\s+is)\s+(this|the)\s+(document|file|pdf|report|paper|deck|presentation)\s+about\b",
+    re.IGNORECASE,
+)
+
+# Every page or section of the document, as opposed to one of them.
+PART_WISE_PATTERN = re.compile(
+    r"\b(page|section|chapter|topic|slide|clause)s?[\s-]*(wise|by[\s-]*(page|section|chapter|topic|slide|clause))\b"
+    r"|\b(each|every|all(\s+the)?)\s+(page|section|chapter|topic|slide|clause)s?\b",
+    re.IGNORECASE,
+)
+SCOPED_PATTERN = re.compile(
+    r"\b(page|section|chapter|slide|clause|article|appendix|annex|schedule|exhibit)s?\b",
+    re.IGNORECASE,
+)
+
+_intent_model = None
+_intent_model_lock = threading.Lock()
+
+
+def load_intent_examples(path=INTENT_DATA_PATH):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [row["question"] for row in rows], [row["intent"] for row in rows]
+
+
+def build_intent_model():
+    """Word and character n-gram TF-IDF features with a logistic regression."""
+    return make_pipeline(
+        FeatureUnion(
+            [
+                ("words", TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True)),
+                (
+                    "chars",
+                    TfidfVectorizer(
+                        analyzer="char_wb", ngram_range=(2, 4), sublinear_tf=True
+                    ),
+                ),
+            ]
+        ),
+        LogisticRegression(C=10, max_iter=1000, class_weight="balanced"),
+    )
+
+
+def get_intent_model():
+    """Train the intent model from the shipped question set on first use."""
+    global _intent_model
+    with _intent_model_lock:
+        if _intent_model is None:
+            questions, intents = load_intent_examples()
+            _intent_model = build_intent_model().fit(questions, intents)
+        return _intent_model
+
+
+def is_scoped_request(question):
+    """Whether the question names one part of a document rather than all of it."""
+    return bool(SCOPED_PATTERN.search(PART_WISE_PATTERN.sub(" ", question)))
+
+
+def match_intent_rules(question):
+    # A summary of one clause, section, chapter or page answers from its pages.
+    if is_scoped_request(question):
+        return "question"
+    if DETAILED_SUMMARY_PATTERN.search(question):
+        return "detailed_summary"
+    if SUMMARY_PATTERN.search(question):
+        return "summary"
+    return None
+
+
+def predict_intent(question, intent_model=None):
+    """Local (intent, confidence): a rule match, else the model's top class."""
+    intent = match_intent_rules(question)
+    if intent:
+        return intent, 1.0
+    intent_model = intent_model or get_intent_model()
+    probabilities = intent_model.predict_proba([question])[0]
+    best = probabilities.argmax()
+    return str(intent_model.classes_[best]), float(probabilities[best])
+
+
+def classify_intent_with_llm(question):
+    """One LLM call choosing between all intents; None if it fails or is unclear."""
+    intent_prompt = f"""
+    The user's question will be provided. Classify it as:
+    - "summary" if it asks for a summary of, or what is in, the entire document(s)
+    - "detailed_summary" if it asks for a detailed, page-wise, section-wise or topic-wise summary of the entire document(s)
+    - "question" for anything else, including summaries of a specific part or topic
+
+    User's question: {question}
+
+    Respond with only one of: summary, detailed_summary, question.
+    """
+    data = {
+        "model": model,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that classifies intents.",
+            },
+            {"role": "user", "content": intent_prompt},
+        ],
+        "temperature": 0.0,
+    }
+    try:
+        response = post_chat_completion(data, timeout=60)
+        response.raise_for_status()
+        answer = (
+            response.json()
+            .get("choices", [{}])[0]
+            .get("message", {})
+            .get("content", "")
+            .strip()
+            .strip("\"'.")
+            .lower()
+        )
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error classifying intent: {e}")
+        return None
+    return answer if answer in INTENTS else None
+
+
+def classify_intent(question, llm_fallback=intent_llm_fallback):
+    """Route a question to "question", "summary" or "detailed_summary".
+
+    Rules and the local model decide offline; only predictions below
+    INTENT_CONFIDENCE_THRESHOLD fall back to a single LLM call.
+    """
+    intent, confidence = predict_intent(question)
+    if confidence < intent_confidence_threshold and llm_fallback:
+        intent = classify_intent_with_llm(question) or intent
+    return intent
@@ -0,0 +1,111 @@
+import math
+import re
+from collections import Counter
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercase word tokens without English stop words."""
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in ENGLISH_STOP_WORDS
+    ]
+
+
+def page_terms(page):
+    image_text = " ".join(
+        analysis.get("explanation", "") for analysis in page.get("image_analysis", [])
+    )
+    return Counter(tokenize(f"{page.get('full_text', '')} {image_text}"))
+
+
+class LexicalIndex:
+    """Incremental BM25 statistics of one document's pages.
+
+    postings maps each term to {page_number: frequency}. Processed documents
+    store theirs with the document, so every session holding the same file
+    shares one copy; search_lexical_indexes ranks several documents together.
+    """
+
+    def __init__(self, postings=None, page_lengths=None, total_length=0):
+        self.postings = postings if postings is not None else {}
+        self.page_lengths = page_lengths if page_lengths is not None else {}
+        self.total_length = total_length
+
+    def add_page(self, page):
+        """Index a single page, replacing any previous version of it."""
+        page_number = page["page_number"]
+        if page_number in self.page_lengths:
+            self.remove_page(page_number)
+        terms = page_terms(page)
+        self.page_lengths[page_number] = sum(terms.values())
+        self.total_length += self.page_lengths[page_number]
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[page_number] = frequency
+
+    def remove_page(self, page_number):
+        self.total_length -= self.page_lengths.pop(page_number)
+        for term in [term for term, postings in self.postings.items() if page_number in postings]:
+            del self.postings[term][page_number]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def to_dict(self):
+        return {
+            "postings": self.postings,
+            "page_lengths": self.page_lengths,
+            "total_length": self.total_length,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["postings"], data["page_lengths"], data["total_length"])
+
+
+def build_lexical_index(document_data):
+    """Index every page of a processed document, as a storable dict."""
+    index = LexicalIndex()
+    for page in document_data["pages"]:
+        index.add_page(page)
+    return index.to_dict()
+
+
+def search_lexical_indexes(indexes, query, top_k, k1=1.5, b=0.75):
+    """Rank the pages of several documents as one BM25 collection.
+
+    indexes maps doc_name to a LexicalIndex. Returns up to top_k
+    (doc_name, page_number, score) tuples, best first.
+    """
+    page_count = sum(len(index.page_lengths) for index in indexes.values())
+    if not page_count:
+        return []
+
+    average_length = sum(index.total_length for index in indexes.values()) / page_count or 1
+    scores = Counter()
+    for term in set(tokenize(query)):
+        postings = {
+            doc_name: index.postings[term]
+            for doc_name, index in indexes.items()
+            if term in index.postings
+        }
+        document_frequency = sum(len(pages) for pages in postings.values())
+        if not document_frequency:
+            continue
+        idf = math.log(1 + (page_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        for doc_name, pages in postings.items():
+            page_lengths = indexes[doc_name].page_lengths
+            for page_number, frequency in pages.items():
+                length = page_lengths[page_number]
+                scores[(doc_name, page_number)] += idf * (
+                    frequency
+                    * (k1 + 1)
+                    / (frequency + k1 * (1 - b + b * length / average_length))
+                )
+
+    return [
+        (doc_name, page_number, score)
+        for (doc_name, page_number), score in scores.most_common(top_k)
+    ]
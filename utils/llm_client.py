@@ -0,0 +1,125 @@
+import json
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from utils.config import (
+    azure_endpoint,
+    api_key,
+    api_version,
+    model,
+    embedding_model,
+    llm_pool_size,
+    llm_rate_limit_retries,
+)
+from utils.llm_scheduler import scheduler, estimate_request_tokens
+from utils.tokens import count_tokens
+
+HEADERS = {"Content-Type": "application/json", "api-key": api_key}
+CHAT_COMPLETIONS_URL = f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}"
+EMBEDDINGS_URL = f"{azure_endpoint}/openai/deployments/{embedding_model}/embeddings?api-version={api_version}"
+DEFAULT_RETRY_AFTER = 5
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide keep-alive session used for every LLM call."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=llm_pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(HEADERS)
+            _session = session
+    return _session
+
+
+def get_retry_after(headers):
+    """Seconds the service asked us to wait, from retry-after-ms or Retry-After."""
+    for name, scale in (("retry-after-ms", 0.001), ("Retry-After", 1)):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return DEFAULT_RETRY_AFTER
+
+
+def _record_usage(entry, response):
+    if response.status_code != 200:
+        return
+    try:
+        total_tokens = response.json().get("usage", {}).get("total_tokens")
+    except ValueError:
+        return
+    if total_tokens:
+        scheduler.record_usage(entry, total_tokens)
+
+
+def post_chat_completion(data, timeout=None):
+    """POST a chat-completions payload over the pooled session, within the rate limits."""
+    tokens = estimate_request_tokens(data)
+    for attempt in range(llm_rate_limit_retries + 1):
+        entry = scheduler.acquire(tokens)
+        response = get_session().post(CHAT_COMPLETIONS_URL, json=data, timeout=timeout)
+        if response.status_code != 429 or attempt == llm_rate_limit_retries:
+            break
+        scheduler.pause(get_retry_after(response.headers))
+    _record_usage(entry, response)
+    return response
+
+
+def stream_chat_completion(data, timeout=None):
+    """Stream a chat completion over SSE, yielding content deltas as they arrive.
+
+    Raises requests.HTTPError before the first delta if the request fails.
+    Usage from the final chunk is recorded with the scheduler.
+    """
+    data = {**data, "stream": True, "stream_options": {"include_usage": True}}
+    tokens = estimate_request_tokens(data)
+    for attempt in range(llm_rate_limit_retries + 1):
+        entry = scheduler.acquire(tokens)
+        response = get_session().post(
+            CHAT_COMPLETIONS_URL, json=data, timeout=timeout, stream=True
+        )
+        if response.status_code != 429 or attempt == llm_rate_limit_retries:
+            break
+        response.close()
+        scheduler.pause(get_retry_after(response.headers))
+
+    with response:
+        response.raise_for_status()
+        # chunk_size=None hands over each network read instead of filling a buffer first.
+        for line in response.iter_lines(chunk_size=None):
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[len(b"data:") :].strip()
+            if payload == b"[DONE]":
+                break
+            chunk = json.loads(payload)
+            total_tokens = (chunk.get("usage") or {}).get("total_tokens")
+            if total_tokens:
+                scheduler.record_usage(entry, total_tokens)
+            for choice in chunk.get("choices", []):
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    yield content
+
+
+def post_embeddings(texts, timeout=None):
+    """POST an embeddings request for a list of texts, within the rate limits."""
+    tokens = sum(count_tokens(text) for text in texts)
+    for attempt in range(llm_rate_limit_retries + 1):
+        entry = scheduler.acquire(tokens)
+        response = get_session().post(
+            EMBEDDINGS_URL, json={"input": texts}, timeout=timeout
+        )
+        if response.status_code != 429 or attempt == llm_rate_limit_retries:
+            break
+        scheduler.pause(get_retry_after(response.headers))
+    _record_usage(entry, response)
+    return response
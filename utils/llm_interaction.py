@@ -1,12 +1,13 @@
 import requests
-from utils.config import azure_endpoint, api_key, api_version, model
+from utils.config import model
+from utils.llm_client import post_chat_completion
+from utils.tokens import count_tokens
 import logging
 import time
 import random
 import re
 import nltk
 from nltk.corpus import stopwords
-import tiktoken
 import concurrent.futures
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import NMF
@@ -16,14 +17,6 @@ logging.basicConfig(
 )
 nltk.download("stopwords", quiet=True)
 
-HEADERS = {"Content-Type": "application/json", "api-key": api_key}
-
-
-def count_tokens(text, model="gpt-4o"):
-    encoding = tiktoken.encoding_for_model(model)
-    tokens = encoding.encode(text)
-    return len(tokens)
-
 
 def preprocess_text(text):
     text = text.lower()
@@ -36,7 +29,6 @@ def preprocess_text(text):
 
 
 def get_image_explanation(base64_image, retries=5, initial_delay=2):
-    headers = HEADERS
     data = {
         "model": model,
         "messages": [
@@ -61,11 +53,9 @@ def get_image_explanation(base64_image, retries=5, initial_delay=2):
         "temperature": 0.0,
     }
 
-    url = f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}"
-
     for attempt in range(retries):
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=120)
+            response = post_chat_completion(data, timeout=120)
             response.raise_for_status()
             return (
                 response.json()
@@ -95,7 +85,6 @@ def get_image_explanation(base64_image, retries=5, initial_delay=2):
 
 
 def generate_system_prompt(document_content):
-    headers = HEADERS
     preprocessed_content = preprocess_text(document_content)
     data = {
         "model": model,
@@ -152,12 +141,7 @@ def generate_system_prompt(document_content):
     }
 
     try:
-        response = requests.post(
-            f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-            headers=headers,
-            json=data,
-            timeout=60,
-        )
+        response = post_chat_completion(data, timeout=60)
         response.raise_for_status()
         prompt_response = (
             response.json()
@@ -181,7 +165,6 @@ def summarize_page(
     base_delay=1,
     max_delay=32,
 ):
-    headers = HEADERS
     preprocessed_page_text = preprocess_text(page_text)
     preprocessed_previous_summary = preprocess_text(previous_summary)
 
@@ -205,12 +188,7 @@ def summarize_page(
     attempt = 0
     while attempt < max_retries:
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=data,
-                timeout=60,
-            )
+            response = post_chat_completion(data, timeout=60)
             response.raise_for_status()
             logging.info(
                 f"Summary retrieved for page {page_number} at {time.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -244,10 +222,8 @@ def is_summary_request(question):
         Determine if this question is about requesting a complete summary of the entire document or a similar request.
         Answer "yes" or "no".
         """
-    response = requests.post(
-        f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-        headers=HEADERS,
-        json={
+    response = post_chat_completion(
+        {
             "model": model,
             "messages": [
                 {
@@ -257,7 +233,7 @@ def is_summary_request(question):
                 {"role": "user", "content": summary_check_prompt},
             ],
             "temperature": 0.0,
-        },
+        }
     )
     return (
         response.json()
@@ -308,12 +284,7 @@ def check_page_relevance(doc_name, page, preprocessed_question):
 
     for attempt in range(5):
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=HEADERS,
-                json=relevance_data,
-                timeout=60,
-            )
+            response = post_chat_completion(relevance_data, timeout=60)
             response.raise_for_status()
             relevance_answer = (
                 response.json()
@@ -392,12 +363,7 @@ def summarize_pages_in_batches(pages, batch_size=10):
 
         for attempt in range(5):
             try:
-                response = requests.post(
-                    f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                    headers=HEADERS,
-                    json=batch_summary_data,
-                    timeout=60,
-                )
+                response = post_chat_completion(batch_summary_data, timeout=60)
                 response.raise_for_status()
                 batch_summary = (
                     response.json()
@@ -417,7 +383,6 @@ def summarize_pages_in_batches(pages, batch_size=10):
 
 
 def is_detailed_summary_request(question):
-    headers = HEADERS
     # LLM prompt to classify the intent
     intent_prompt = f"""
     You are an assistant that classifies user intents. The user's question will be provided, 
@@ -444,12 +409,7 @@ def is_detailed_summary_request(question):
 
     try:
         # Make a request to the LLM
-        response = requests.post(
-            f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-            headers=headers,
-            json=data,
-            timeout=60,
-        )
+        response = post_chat_completion(data, timeout=60)
         response.raise_for_status()
         return (
             response.json()
@@ -468,7 +428,6 @@ def is_detailed_summary_request(question):
 
 
 def ask_question(documents, question, chat_history):
-    headers = HEADERS
     preprocessed_question = preprocess_text(question)
 
     # Check for summary-related intents
@@ -538,11 +497,7 @@ def ask_question(documents, question, chat_history):
             }
 
             # Call the LLM to generate the final summary
-            final_response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=final_summary_data,
-            )
+            final_response = post_chat_completion(final_summary_data)
             final_summary = (
                 final_response.json()
                 .get("choices", [{}])[0]
@@ -640,12 +595,7 @@ def ask_question(documents, question, chat_history):
 
     for attempt in range(5):
         try:
-            response = requests.post(
-                f"{azure_endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}",
-                headers=headers,
-                json=final_data,
-                timeout=60,
-            )
+            response = post_chat_completion(final_data, timeout=60)
             response.raise_for_status()
             answer_content = (
                 response.json()
@@ -0,0 +1,269 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+import redis
+from utils.config import llm_requests_per_minute, llm_tokens_per_minute
+from utils.tokens import count_tokens
+from utils.redis_client import redis_client
+
+WINDOW_SECONDS = 60
+DEFAULT_COMPLETION_TOKENS = 1000
+IMAGE_TOKEN_ESTIMATE = 765
+LOW_DETAIL_IMAGE_TOKENS = 85
+
+current_lane = contextvars.ContextVar("llm_lane", default="default")
+
+
+def estimate_request_tokens(data):
+    """Estimate prompt plus completion tokens of a chat-completions payload."""
+    tokens = 0
+    for message in data.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                tokens += count_tokens(part.get("text", ""))
+            elif part.get("image_url", {}).get("detail") == "low":
+                tokens += LOW_DETAIL_IMAGE_TOKENS
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens + data.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+
+
+@contextmanager
+def llm_lane(name):
+    """Tag every LLM request issued inside the block with a fairness lane."""
+    token = current_lane.set(name)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+def submit_in_lane(executor, fn, *args, **kwargs):
+    """Submit fn to an executor so its LLM requests stay in the caller's lane."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call("TIME")
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local tokens, rpm, tpm, window = tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local paused_until = tonumber(redis.call("GET", KEYS[3]) or 0)
+if now < paused_until then
+    return paused_until - now
+end
+for _, expired in ipairs(redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", now - window)) do
+    redis.call("ZREM", KEYS[1], expired)
+    redis.call("HDEL", KEYS[2], expired)
+end
+local count = redis.call("ZCARD", KEYS[1])
+if count > 0 then
+    local used = 0
+    for _, granted in ipairs(redis.call("HVALS", KEYS[2])) do
+        used = used + tonumber(granted)
+    end
+    if count >= rpm or used + tokens > tpm then
+        local oldest = redis.call("ZRANGE", KEYS[1], 0, 0, "WITHSCORES")
+        return math.max(tonumber(oldest[2]) + window - now, 1)
+    end
+end
+redis.call("ZADD", KEYS[1], now, ARGV[1])
+redis.call("HSET", KEYS[2], ARGV[1], tokens)
+redis.call("PEXPIRE", KEYS[1], window)
+redis.call("PEXPIRE", KEYS[2], window)
+return 0
+"""
+
+RECORD_USAGE_SCRIPT = """
+if redis.call("HEXISTS", KEYS[1], ARGV[1]) == 1 then
+    redis.call("HSET", KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+PAUSE_SCRIPT = """
+local now_parts = redis.call("TIME")
+local resume_at = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000) + tonumber(ARGV[1])
+if resume_at > tonumber(redis.call("GET", KEYS[1]) or 0) then
+    redis.call("SET", KEYS[1], resume_at, "PX", ARGV[1])
+end
+return 0
+"""
+
+
+class LocalQuota:
+    """Sliding-window requests/tokens-per-minute quota of this process alone."""
+
+    name = "local"
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()
+        self.tokens_in_window = 0
+        self.paused_until = 0.0
+
+    def _prune(self, now):
+        while self.window and self.window[0][0] <= now - WINDOW_SECONDS:
+            _, tokens = self.window.popleft()
+            self.tokens_in_window -= tokens
+
+    def _wait_time(self, tokens, now):
+        if now < self.paused_until:
+            return self.paused_until - now
+        if len(self.window) >= self.requests_per_minute:
+            return self.window[0][0] + WINDOW_SECONDS - now
+        if self.window and self.tokens_in_window + tokens > self.tokens_per_minute:
+            return self.window[0][0] + WINDOW_SECONDS - now
+        return 0
+
+    def try_acquire(self, tokens):
+        """Grant a request of this size now as (entry, 0), or return (None, seconds to wait)."""
+        now = time.monotonic()
+        self._prune(now)
+        wait_time = self._wait_time(tokens, now)
+        if wait_time > 0:
+            return None, wait_time
+        entry = [now, tokens]
+        self.window.append(entry)
+        self.tokens_in_window += tokens
+        return entry, 0
+
+    def record_usage(self, entry, total_tokens):
+        if any(granted is entry for granted in self.window):
+            self.tokens_in_window += total_tokens - entry[1]
+            entry[1] = total_tokens
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class RedisQuota:
+    """Requests/tokens-per-minute quota shared by every process through Redis.
+
+    Granted requests are a sorted set of ids scored by grant time plus a hash
+    of their token counts, and a 429 pause is one shared key. Each check runs
+    as a Lua script on Redis time, so web processes and Celery workers on any
+    host draw from one window instead of each having the full budget.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, requests_per_minute, tokens_per_minute, prefix="llm_quota"):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_key = f"{prefix}:requests"
+        self.tokens_key = f"{prefix}:tokens"
+        self.paused_key = f"{prefix}:paused_until"
+        self.acquire_script = client.register_script(ACQUIRE_SCRIPT)
+        self.record_usage_script = client.register_script(RECORD_USAGE_SCRIPT)
+        self.pause_script = client.register_script(PAUSE_SCRIPT)
+
+    def try_acquire(self, tokens):
+        entry = uuid.uuid4().hex
+        wait_ms = self.acquire_script(
+            keys=[self.requests_key, self.tokens_key, self.paused_key],
+            args=[
+                entry,
+                tokens,
+                self.requests_per_minute,
+                self.tokens_per_minute,
+                WINDOW_SECONDS * 1000,
+            ],
+        )
+        return (entry, 0) if wait_ms == 0 else (None, wait_ms / 1000)
+
+    def record_usage(self, entry, total_tokens):
+        self.record_usage_script(keys=[self.tokens_key], args=[entry, total_tokens])
+
+    def pause(self, seconds):
+        self.pause_script(keys=[self.paused_key], args=[max(int(seconds * 1000), 1)])
+
+
+class LLMScheduler:
+    """Requests/tokens-per-minute gate that grants requests round-robin across lanes.
+
+    Lanes take turns within the process; the quota itself lives in Redis so
+    it is shared across processes, with an in-process quota as the fallback
+    when Redis is unavailable.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, client=redis_client):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.client = client
+        self.condition = threading.Condition()
+        self.quota = None
+        self.lanes = deque()
+        self.waiting = {}
+
+    def _use_local_quota(self):
+        self.quota = LocalQuota(self.requests_per_minute, self.tokens_per_minute)
+
+    def _call_quota(self, method, *args):
+        # Called with self.condition held.
+        if self.quota is None:
+            try:
+                self.client.ping()
+                self.quota = RedisQuota(
+                    self.client, self.requests_per_minute, self.tokens_per_minute
+                )
+            except redis.exceptions.RedisError as e:
+                logging.warning(f"Redis unavailable for the LLM quota, using a local one: {e}")
+                self._use_local_quota()
+        try:
+            return getattr(self.quota, method)(*args)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"LLM quota falling back to this process after Redis error: {e}")
+            self._use_local_quota()
+            return getattr(self.quota, method)(*args)
+
+    def acquire(self, tokens, lane=None):
+        """Block until a request of this size fits the quota and it is this lane's turn."""
+        lane = lane or current_lane.get()
+        ticket = object()
+        with self.condition:
+            if lane not in self.waiting:
+                self.waiting[lane] = deque()
+                self.lanes.append(lane)
+            self.waiting[lane].append(ticket)
+
+            while True:
+                wait_time = None
+                if self.lanes[0] == lane and self.waiting[lane][0] is ticket:
+                    entry, wait_time = self._call_quota("try_acquire", tokens)
+                    if entry is not None:
+                        break
+                self.condition.wait(wait_time)
+
+            self.waiting[lane].popleft()
+            self.lanes.popleft()
+            if self.waiting[lane]:
+                self.lanes.append(lane)
+            else:
+                del self.waiting[lane]
+            self.condition.notify_all()
+            return entry
+
+    def record_usage(self, entry, total_tokens):
+        """Replace the estimate of a granted request with the tokens actually billed."""
+        with self.condition:
+            self._call_quota("record_usage", entry, total_tokens)
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Hold back every lane of every process, e.g. for the Retry-After of a 429 response."""
+        with self.condition:
+            self._call_quota("pause", seconds)
+            logging.warning(f"LLM rate limit hit, pausing requests for {seconds:.1f}s")
+            self.condition.notify_all()
+
+
+scheduler = LLMScheduler(llm_requests_per_minute, llm_tokens_per_minute)
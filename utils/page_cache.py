@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+import redis
+from utils.config import model, page_cache_ttl, page_cache_max_entries, page_cache_path
+from utils.redis_client import redis_client
+
+CACHE_PREFIX = "page_cache"
+LRU_KEY = f"{CACHE_PREFIX}:lru"
+
+
+def normalize_text(text):
+    """Collapse whitespace so layout-only differences map to the same key."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def make_cache_key(kind, content, system_prompt, model_name=model):
+    """Build a content-addressed key from the page content, prompt and model."""
+    digest = hashlib.sha256()
+    for part in (kind, content, system_prompt or "", model_name or ""):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return f"{kind}:{digest.hexdigest()}"
+
+
+class RedisPageCache:
+    name = "redis"
+
+    def __init__(self, client, ttl, max_entries):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, key):
+        value = self.client.get(f"{CACHE_PREFIX}:{key}")
+        if value is None:
+            return None
+        self.client.zadd(LRU_KEY, {key: time.time()})
+        return value.decode("utf-8")
+
+    def set(self, key, value):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.set(f"{CACHE_PREFIX}:{key}", value, ex=self.ttl)
+        pipe.zadd(LRU_KEY, {key: now})
+        pipe.zremrangebyscore(LRU_KEY, 0, now - self.ttl)
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+
+        if size > self.max_entries:
+            evicted = self.client.zpopmin(LRU_KEY, size - self.max_entries)
+            if evicted:
+                self.client.delete(
+                    *[f"{CACHE_PREFIX}:{member.decode('utf-8')}" for member, _ in evicted]
+                )
+
+
+class SQLitePageCache:
+    name = "sqlite"
+
+    def __init__(self, path, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS page_cache ("
+                "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS page_cache_accessed ON page_cache (accessed)"
+            )
+
+    def get(self, key):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT value FROM page_cache WHERE key = ? AND created >= ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE page_cache SET accessed = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO page_cache VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self.connection.execute(
+                "DELETE FROM page_cache WHERE created < ?", (now - self.ttl,)
+            )
+            self.connection.execute(
+                "DELETE FROM page_cache WHERE key IN ("
+                "SELECT key FROM page_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class PageCache:
+    """Persistent cache of per-page LLM results, Redis first with a SQLite fallback."""
+
+    def __init__(self, ttl=page_cache_ttl, max_entries=page_cache_max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _get_backend(self):
+        with self.lock:
+            if self.backend is None:
+                try:
+                    redis_client.ping()
+                    self.backend = RedisPageCache(
+                        redis_client, self.ttl, self.max_entries
+                    )
+                except redis.exceptions.RedisError as e:
+                    logging.warning(
+                        f"Redis unavailable for page cache, using SQLite: {e}"
+                    )
+                    self._use_sqlite()
+            return self.backend
+
+    def _use_sqlite(self):
+        self.backend = SQLitePageCache(page_cache_path, self.ttl, self.max_entries)
+
+    def _call(self, method, *args):
+        backend = self._get_backend()
+        try:
+            return getattr(backend, method)(*args)
+        except redis.exceptions.RedisError as e:
+            logging.warning(f"Page cache falling back to SQLite after Redis error: {e}")
+            with self.lock:
+                if self.backend is backend:
+                    self._use_sqlite()
+            return getattr(self.backend, method)(*args)
+
+    def get(self, kind, content, system_prompt):
+        """Return the cached result for this page content, or None."""
+        key = make_cache_key(kind, normalize_text(content), system_prompt)
+        try:
+            cached = self._call("get", key)
+        except Exception as e:
+            logging.error(f"Error reading page cache: {e}")
+            cached = None
+
+        with self.lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached
+
+    def set(self, kind, content, system_prompt, result):
+        """Store a result unless it is empty or an error message."""
+        if not result or result.startswith("Error"):
+            return
+        key = make_cache_key(kind, normalize_text(content), system_prompt)
+        try:
+            self._call("set", key, result)
+        except Exception as e:
+            logging.error(f"Error writing page cache: {e}")
+
+    def get_or_compute(self, kind, content, system_prompt, compute):
+        """Return the cached result for this page content or compute and store it."""
+        cached = self.get(kind, content, system_prompt)
+        if cached is not None:
+            return cached
+
+        result = compute()
+        self.set(kind, content, system_prompt, result)
+        return result
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend.name if self.backend else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+page_cache = PageCache()
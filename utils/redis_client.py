@@ -0,0 +1,8 @@
+import redis
+from utils.config import redis_host, redis_pass
+
+redis_client = redis.Redis(
+    host=redis_host,
+    port=6379,
+    password=redis_pass,
+)
@@ -0,0 +1,261 @@
+import logging
+import random
+import time
+import concurrent.futures
+import requests
+from sklearn.decomposition import NMF
+from sklearn.feature_extraction.text import TfidfVectorizer
+from utils.config import model, summary_section_tokens, summary_fan_in
+from utils.llm_client import post_chat_completion
+from utils.llm_scheduler import submit_in_lane
+from utils.page_cache import page_cache
+from utils.tokens import count_tokens
+
+DOCUMENT_TOPICS = 5
+TOPIC_WORDS = 5
+
+SECTION_PROMPT = (
+    "Summarize the following pages concisely while retaining the key points and mention the range of pages given as input. "
+    "Provide line or paragraph number attribution wherever present. "
+    "Present the summary in a proper human readable format using subheadings and bullets wherever necessary. Don't mention as summary."
+)
+REDUCE_PROMPT = (
+    "Combine the following summaries into a single, comprehensive summary. "
+    "Keep the page references and line or paragraph number attribution wherever present. "
+    "Ensure the summary is thorough yet concise, presenting the key points in a structured, readable format using subheaders and bullets that highlight major themes and strategies."
+)
+
+
+def page_text(page):
+    text = f"Page {page['page_number']}: {page.get('text_summary', '')}"
+    image_text = " ".join(
+        analysis.get("explanation", "") for analysis in page.get("image_analysis", [])
+    )
+    return f"{text}\nImage Analysis: {image_text}" if image_text else text
+
+
+def group_by_tokens(texts, max_tokens, max_items=None):
+    """Split texts, in order, into groups under a token budget and item count."""
+    groups = []
+    group = []
+    group_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if group and (
+            group_tokens + tokens > max_tokens
+            or (max_items is not None and len(group) >= max_items)
+        ):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def summarize_text(instructions, content, retries=5):
+    """One summarization call, cached by its instructions and content."""
+
+    def compute():
+        data = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You are an assistant that creates concise summaries.",
+                },
+                {"role": "user", "content": f"{instructions}\n\n{content}"},
+            ],
+            "temperature": 0.0,
+        }
+        for attempt in range(retries):
+            try:
+                response = post_chat_completion(data, timeout=120)
+                response.raise_for_status()
+                return (
+                    response.json()
+                    .get("choices", [{}])[0]
+                    .get("message", {})
+                    .get("content", "")
+                    .strip()
+                )
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Error summarizing content: {e}")
+                if attempt < retries - 1:
+                    time.sleep((2**attempt) + random.uniform(0, 1))
+        return "Error: Unable to summarize this content."
+
+    return page_cache.get_or_compute("summary_tree", content, instructions, compute)
+
+
+def summarize_groups(executor, groups_by_key):
+    """Summarize {key: [(instructions, [texts])]} in parallel, keeping group order."""
+    futures = {
+        key: [
+            submit_in_lane(executor, summarize_text, instructions, "\n\n".join(texts))
+            for instructions, texts in groups
+        ]
+        for key, groups in groups_by_key.items()
+    }
+    return {
+        key: [future.result() for future in key_futures]
+        for key, key_futures in futures.items()
+    }
+
+
+def reduce_summaries(executor, summaries_by_key, instructions_by_key):
+    """Merge each key's summaries level by level with bounded fan-in until one remains."""
+    summaries_by_key = dict(summaries_by_key)
+    while True:
+        pending = {
+            key: [
+                (instructions_by_key[key], group)
+                for group in group_by_tokens(
+                    summaries, summary_section_tokens, summary_fan_in
+                )
+            ]
+            for key, summaries in summaries_by_key.items()
+            if len(summaries) > 1
+        }
+        if not pending:
+            return {
+                key: summaries[0] if summaries else ""
+                for key, summaries in summaries_by_key.items()
+            }
+        for key, groups in pending.items():
+            if len(groups) == len(summaries_by_key[key]):
+                # Each summary fills the budget alone; merge pairs to keep shrinking.
+                summaries = summaries_by_key[key]
+                groups[:] = [
+                    (instructions_by_key[key], summaries[i : i + 2])
+                    for i in range(0, len(summaries), 2)
+                ]
+        summaries_by_key.update(summarize_groups(executor, pending))
+
+
+def get_section_groups(document_data):
+    instructions = f"{SECTION_PROMPT}\nDocument: {document_data['document_name']}"
+    return [
+        (instructions, group)
+        for group in group_by_tokens(
+            [page_text(page) for page in document_data["pages"]],
+            summary_section_tokens,
+        )
+    ]
+
+
+def extract_document_topics(pages, max_topics=DOCUMENT_TOPICS, top_words=TOPIC_WORDS):
+    """NMF topics over the pages of one document, as comma-separated top terms."""
+    texts = [
+        page.get("full_text", "").split("\n Paragraph attribution")[0] for page in pages
+    ]
+    texts = [text for text in texts if text.strip()]
+    if not texts:
+        return []
+    try:
+        vectorizer = TfidfVectorizer(stop_words="english")
+        tfidf = vectorizer.fit_transform(texts)
+        nmf = NMF(
+            n_components=min(max_topics, *tfidf.shape), random_state=42, max_iter=500
+        )
+        nmf.fit(tfidf)
+        feature_names = vectorizer.get_feature_names_out()
+        return [
+            ", ".join(feature_names[i] for i in topic.argsort()[: -top_words - 1 : -1])
+            for topic in nmf.components_
+        ]
+    except ValueError as e:
+        logging.error(f"Error extracting document topics: {e}")
+        return []
+
+
+def build_document_summary(document_data):
+    """Ingest-time summary artifact: section summaries, document summary and topics.
+
+    Sections are token-bounded groups of pages summarized in parallel, then
+    reduced with bounded fan-in into one document summary. Every call is
+    cached by content, so re-ingesting a document reuses it.
+    """
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        sections = summarize_groups(
+            executor, {"document": get_section_groups(document_data)}
+        )["document"]
+        summary = reduce_summaries(
+            executor,
+            {"document": sections},
+            {"document": f"{REDUCE_PROMPT}\nDocument: {document_data['document_name']}"},
+        )["document"]
+    return {
+        "pages": len(document_data["pages"]),
+        "sections": sections,
+        "summary": summary,
+        "topics": extract_document_topics(document_data["pages"]),
+    }
+
+
+def get_page_count(document_data):
+    """Page count from a stored document's manifest, without loading its pages."""
+    page_count = document_data.get("page_count")
+    return page_count if page_count is not None else len(document_data["pages"])
+
+
+def get_document_summaries(documents):
+    """Precomputed summary artifact of each document, building any missing or stale one.
+
+    An artifact is stale when the document has gained pages since it was built,
+    e.g. a summary requested while the document was still being ingested.
+    """
+    missing = [
+        doc_name
+        for doc_name, doc_data in documents.items()
+        if doc_data.get("document_summary", {}).get("pages") != get_page_count(doc_data)
+    ]
+    if missing:
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = {
+                doc_name: submit_in_lane(
+                    executor, build_document_summary, documents[doc_name]
+                )
+                for doc_name in missing
+            }
+            for doc_name, future in futures.items():
+                documents[doc_name]["document_summary"] = future.result()
+    return {
+        doc_name: doc_data["document_summary"]
+        for doc_name, doc_data in documents.items()
+    }
+
+
+def summarize_documents(documents, detailed=False):
+    """Answer a summary request from the documents' precomputed summaries.
+
+    A detailed summary returns the ordered section summaries of each document.
+    Otherwise a single document's summary is returned as is, and several are
+    merged by one combination step. Returns (summary, input_tokens).
+    """
+    summaries = get_document_summaries(documents)
+    if detailed:
+        parts = [
+            f"## {documents[doc_name]['document_name']}\n\n"
+            + "\n\n".join(document_summary["sections"])
+            for doc_name, document_summary in summaries.items()
+        ]
+        summary = "\n\n".join(parts)
+        return summary, count_tokens(summary)
+
+    parts = [
+        f"Document: {documents[doc_name]['document_name']}\n"
+        f"Key topics: {' | '.join(document_summary['topics'])}\n"
+        f"{document_summary['summary']}"
+        for doc_name, document_summary in summaries.items()
+    ]
+    input_tokens = sum(count_tokens(part) for part in parts)
+    if len(summaries) == 1:
+        return next(iter(summaries.values()))["summary"], input_tokens
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        summary = reduce_summaries(
+            executor, {"documents": parts}, {"documents": REDUCE_PROMPT}
+        )["documents"]
+    return summary, input_tokens
@@ -0,0 +1,45 @@
+import threading
+import tiktoken
+from utils.config import model
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tokenizer of the configured model, loaded once per process."""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    _encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text or ""))
+
+
+def count_page_tokens(page):
+    """Tokens of a page's text and image explanations, counted once at ingest."""
+    return count_tokens(page.get("full_text", "")) + sum(
+        count_tokens(analysis.get("explanation", ""))
+        for analysis in page.get("image_analysis", [])
+    )
+
+
+def get_page_tokens(page):
+    """The page's stored token count; pages stored without one are counted now."""
+    tokens = page.get("tokens")
+    return tokens if tokens is not None else count_page_tokens(page)
+
+
+def get_document_tokens(document_data):
+    """The document's stored token total, or the sum of its page counts."""
+    tokens = document_data.get("tokens")
+    if tokens is not None:
+        return tokens
+    return sum(get_page_tokens(page) for page in document_data["pages"])
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import redis
+import requests
+from nltk.corpus import stopwords
+from utils.config import (
+    bing_key,
+    bing_endpoint,
+    web_search_deadline,
+    web_search_cache_ttl,
+)
+from utils.redis_client import redis_client
+
+WEB_SEARCH_RESULTS = 3
+WEB_SEARCH_WORKERS = 4
+MAX_QUERY_WORDS = 12
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=WEB_SEARCH_WORKERS, thread_name_prefix="web-search"
+)
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update({"Ocp-Apim-Subscription-Key": bing_key or ""})
+    return _session
+
+
+def normalize_query(question):
+    """Lowercased keywords of a question: punctuation and stopwords removed."""
+    words = re.sub(r"[^\w\s]", " ", question.lower()).split()
+    try:
+        stop_words = set(stopwords.words("english"))
+    except LookupError:
+        stop_words = set()
+    keywords = [word for word in words if word not in stop_words] or words
+    return " ".join(keywords[:MAX_QUERY_WORDS])
+
+
+def get_cache_key(query):
+    return f"web_search:{hashlib.sha256(query.encode('utf-8')).hexdigest()}"
+
+
+def search_bing(query, timeout=web_search_deadline):
+    """Search for the top Bing result URLs."""
+    params = {
+        "q": query,
+        "textDecorations": True,
+        "textFormat": "HTML",
+        "count": WEB_SEARCH_RESULTS,
+    }
+    response = get_session().get(bing_endpoint, params=params, timeout=timeout)
+    response.raise_for_status()
+    return [
+        web_page["url"]
+        for web_page in response.json().get("webPages", {}).get("value", [])
+    ]
+
+
+def search_web(query):
+    """Bing results for a normalized query, served from Redis when cached."""
+    cache_key = get_cache_key(query)
+    try:
+        cached = redis_client.get(cache_key)
+        if cached is not None:
+            return json.loads(cached)
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Web search cache unavailable: {e}")
+
+    results = search_bing(query)
+    try:
+        redis_client.set(cache_key, json.dumps(results), ex=web_search_cache_ttl)
+    except redis.exceptions.RedisError as e:
+        logging.warning(f"Unable to cache web search results: {e}")
+    return results
+
+
+def start_web_search(question):
+    """Start searching the web for a question in the background.
+
+    Returns (future, started_at) for get_web_results, or None when no search
+    endpoint is configured or the question has no searchable words.
+    """
+    if not (bing_key and bing_endpoint):
+        return None
+    query = normalize_query(question)
+    if not query:
+        return None
+    return _executor.submit(search_web, query), time.monotonic()
+
+
+def get_web_results(search, deadline=web_search_deadline):
+    """Results of a started search, or [] if it failed or misses its deadline.
+
+    The deadline counts from when the search started, so a search that ran
+    alongside a long answer is collected without any further wait.
+    """
+    if search is None:
+        return []
+    future, started_at = search
+    try:
+        return future.result(
+            timeout=max(0.0, started_at + deadline - time.monotonic())
+        )
+    except TimeoutError:
+        logging.warning(f"Web search skipped after missing its {deadline}s deadline")
+    except Exception as e:
+        logging.error(f"Error searching the web: {e}")
+    return []